@@ -1,213 +1,393 @@
-import random
 import heapq
 import numpy as np
-from typing import List, Set, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
-from models import Note, MusicalSection, KeyEvent, Finger
-from core import TempoMap, get_time_groups
+from models import NoteTable, NoteOverlay, MusicalSection, KeyEvent, Finger, HAND_UNKNOWN, HAND_LEFT, HAND_RIGHT
+from core import TempoMap, TimeGroups, ConcurrencyIndex
+
+def round_hundredths(times) -> np.ndarray:
+    # round(t, 2) for each time, as integer hundredths.
+    times = np.asarray(times, dtype=np.float64)
+    scaled = times * 100
+    hundredths = np.rint(scaled)
+    # round() rounds the exact binary value, which t * 100 may already have rounded onto a half. Near a half,
+    # the sign of t * 200 - (2k + 1) is taken exactly from a Veltkamp split of t; exact ties go to even.
+    near = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    if len(near):
+        t, lower = times[near], np.floor(scaled[near])
+        split = t * 134217729.0
+        high = split - (split - t)
+        excess = (high * 200 - (2 * lower + 1)) + (t - high) * 200
+        hundredths[near] = np.where(excess > 0, lower + 1, np.where(excess < 0, lower, lower + lower % 2))
+    return hundredths.astype(np.int64)
+
+def _decayed_carries(sums: np.ndarray, decay: float, initial: float) -> np.ndarray:
+    # carries[s] = decay * (carries[s-1] + sums[s-1]) from carries[0] = initial, in blocks that keep decay**+-s finite.
+    carries = np.empty(len(sums) + 1)
+    carries[0] = initial
+    if decay == 0:
+        carries[1:] = 0.0
+        return carries
+    block = len(sums) if abs(decay) == 1 else max(1, int(500 / abs(np.log2(abs(decay)))))
+    for lo in range(0, len(sums), block):
+        hi = min(lo + block, len(sums))
+        scale = float(decay) ** np.arange(1, hi - lo + 1)
+        carries[lo + 1:hi + 1] = scale * (carries[lo] + np.cumsum(sums[lo:hi] / scale * decay))
+    return carries
 
 class Humanizer:
+    CHORD_ROLL_STEP = 0.006
+
     def __init__(self, config: Dict, debug_log: Optional[List[str]] = None):
         self.config = config
         self.debug_log = debug_log
+        # humanize_seed pins every random draw; None draws fresh entropy.
+        self.rng = np.random.default_rng(config.get('humanize_seed'))
         self.left_hand_drift = 0.0
         self.right_hand_drift = 0.0
 
-    def apply_to_hand(self, notes: List[Note], hand: str, resync_points: Set[float]):
-        if not any([self.config.get('vary_timing'), self.config.get('vary_articulation'), self.config.get('enable_drift_correction'), self.config.get('enable_chord_roll')]): return
+    def apply_to_hand(self, notes: NoteOverlay, hand: str, resync_points: np.ndarray, time_groups: Optional[TimeGroups] = None):
+        # In place over one hand's start-sorted notes; resync_points come from round_hundredths.
+        vary_timing, vary_articulation = self.config.get('vary_timing'), self.config.get('vary_articulation')
+        drift_correction, chord_roll = self.config.get('enable_drift_correction'), self.config.get('enable_chord_roll')
+        if not any([vary_timing, vary_articulation, drift_correction, chord_roll]) or not len(notes): return
         
-        time_groups = get_time_groups(notes)
-        for group in time_groups:
-            is_resync_point = round(group[0].start_time, 2) in resync_points
-            
-            if self.config.get('enable_drift_correction') and is_resync_point:
-                if hand == 'left': self.left_hand_drift *= self.config.get('drift_decay_factor')
-                else: self.right_hand_drift *= self.config.get('drift_decay_factor')
-            
-            group_timing_offset = 0.0
-            if self.config.get('vary_timing'):
-                sigma = self.config.get('timing_variance')
-                group_timing_offset = random.gauss(0, sigma)
-                group_timing_offset = max(-3*sigma, min(3*sigma, group_timing_offset))
-
-            group_articulation = self.config.get('articulation')
-            if self.config.get('vary_articulation'):
-                group_articulation -= (random.random() * 0.1)
-                
-            if self.config.get('enable_chord_roll') and len(group) > 1:
-                group.sort(key=lambda n: n.pitch)
-                for i, note in enumerate(group):
-                    note.start_time += (i * 0.006)
-                    
-            for note in group:
-                current_drift = self.left_hand_drift if hand == 'left' else self.right_hand_drift
-                note.start_time += group_timing_offset
-                if self.config.get('enable_drift_correction'):
-                    note.start_time += current_drift
-                
-                note.duration *= group_articulation
-                if note.duration < 0.03: note.duration = 0.03
+        starts, durations = notes.start, notes.duration
+        if time_groups is None: time_groups = TimeGroups.build(starts)
+        group_count, group_ids = len(time_groups), time_groups.group_ids()
+        first_starts = starts[time_groups.firsts]
+
+        offsets = np.zeros(group_count)
+        if vary_timing:
+            sigma = self.config.get('timing_variance')
+            offsets = np.clip(self.rng.normal(0.0, sigma, group_count), -3 * sigma, 3 * sigma)
+        articulation = np.full(group_count, self.config.get('articulation'), dtype=np.float64)
+        if vary_articulation: articulation -= self.rng.random(group_count) * 0.1
+
+        if chord_roll:
+            # Roll each chord upward from its lowest note; rank is the note's place in the group by pitch.
+            rolled = np.lexsort((notes.pitch, group_ids))
+            starts[rolled] += (np.arange(len(rolled)) - time_groups.firsts[group_ids]) * self.CHORD_ROLL_STEP
 
-            if self.config.get('enable_drift_correction'):
-                if hand == 'left': self.left_hand_drift += group_timing_offset
-                else: self.right_hand_drift += group_timing_offset
+        shift = offsets
+        if drift_correction:
+            initial = self.left_hand_drift if hand == 'left' else self.right_hand_drift
+            resync = np.isin(round_hundredths(first_starts), resync_points)
+            drift, final = self._accumulate_drift(offsets, resync, self.config.get('drift_decay_factor'), initial)
+            if hand == 'left': self.left_hand_drift = final
+            else: self.right_hand_drift = final
+            shift = offsets + drift
+        starts += shift[group_ids]
+        durations[:] = np.maximum(durations * articulation[group_ids], 0.03)
 
-    def apply_tempo_rubato(self, all_notes: List[Note], sections: List[MusicalSection]):
-        if not self.config.get('enable_tempo_sway'): return
+    @staticmethod
+    def _accumulate_drift(offsets: np.ndarray, resync: np.ndarray, decay: float, initial: float) -> Tuple[np.ndarray, float]:
+        # Drift carried into each group: decayed at resync groups, grown by every group's offset.
+        segment = np.cumsum(resync)
+        sums = np.bincount(segment, weights=offsets, minlength=int(segment[-1]) + 1)
+        carries = _decayed_carries(sums, decay, initial)
+        running = np.cumsum(offsets) - offsets
+        segment_firsts = np.searchsorted(segment, np.arange(len(sums)))
+        within = running - running[segment_firsts][segment]
+        return carries[segment] + within, float(carries[-2] + sums[-1])
+
+    def apply_tempo_rubato(self, all_notes: NoteOverlay, sections: List[MusicalSection]):
+        if not self.config.get('enable_tempo_sway') or not sections or not len(all_notes): return
         base_intensity = self.config.get('tempo_sway_intensity', 0.0)
         invert_sway = self.config.get('invert_tempo_sway', False)
-        note_map = {note.id: note for note in all_notes}
-        for section in sections:
-            pace_multiplier = 1.0
-            if section.pace_label == 'fast': pace_multiplier = 1.5 if invert_sway else 0.25
-            elif section.pace_label == 'slow': pace_multiplier = 0.25 if invert_sway else 1.5
-            section_duration = section.end_time - section.start_time
-            if section_duration < 1.0: continue
-            intensity = base_intensity * pace_multiplier
-            for note in section.notes:
-                if note.id in note_map:
-                    rel_pos = (note.start_time - section.start_time) / section_duration
-                    time_shift = np.sin(rel_pos * np.pi) * intensity
-                    note_map[note.id].start_time -= time_shift
+        pace_multiplier = {'fast': 1.5 if invert_sway else 0.25, 'slow': 0.25 if invert_sway else 1.5}
+        section_start = np.array([section.start_time for section in sections], dtype=np.float64)
+        section_duration = np.array([section.end_time for section in sections], dtype=np.float64) - section_start
+        intensity = np.array([base_intensity * pace_multiplier.get(section.pace_label, 1.0) for section in sections], dtype=np.float64)
+        swaying = np.flatnonzero(section_duration >= 1.0)
+        if not len(swaying): return
+
+        # One row per (section, note): the sway is a half sine over the section, from the unhumanized start.
+        section_id = np.repeat(swaying, [len(sections[i].notes) for i in swaying.tolist()])
+        note_ids = np.concatenate([sections[i].notes.id for i in swaying.tolist()])
+        note_starts = np.concatenate([sections[i].notes.start for i in swaying.tolist()])
+        rel_pos = (note_starts - section_start[section_id]) / section_duration[section_id]
+        time_shift = np.sin(rel_pos * np.pi) * intensity[section_id]
+
+        id_order = np.argsort(all_notes.id, kind='stable')
+        sorted_ids = all_notes.id[id_order]
+        found = np.minimum(np.searchsorted(sorted_ids, note_ids), len(sorted_ids) - 1)
+        present = sorted_ids[found] == note_ids
+        np.subtract.at(all_notes.start, id_order[found[present]], time_shift[present])
+
+def _state_cost(state) -> float:
+    return state[0]
 
 class FingeringEngine:
+    # Beam search over chord-group hand splits with the hand cost model of backup/1.1.py; width 0 splits around middle C.
+    TRAVEL_WEIGHT, RECENCY_WEIGHT, STRETCH_WEIGHT = 1.0, 150.0, 0.5
+    CROSSOVER_PENALTY, THUMB_ON_BLACK_KEY_PENALTY = 50.0, 20.0
+    UNREACHABLE_CHORD_PENALTY = 1000.0
     MAX_HAND_SPAN = 14
-    def __init__(self):
+    HOME_PITCHES = (48, 72)
+    DEFAULT_BEAM_WIDTH = 4
+
+    def __init__(self, beam_width: int = DEFAULT_BEAM_WIDTH):
         self.fingers = [Finger(id=i, hand='left') for i in range(5)] + [Finger(id=i, hand='right') for i in range(5, 10)]
+        self.beam_width = beam_width
+
+    def assign_hands(self, notes: NoteTable, time_groups: Optional[TimeGroups] = None):
+        if not len(notes): return
+        if time_groups is None: time_groups = TimeGroups.build(notes.start)
+        if self.beam_width > 0: self._assign_by_beam_search(notes, time_groups)
+        else: self._assign_by_average_pitch(notes, time_groups)
+
+    @staticmethod
+    def _assign_by_average_pitch(notes: NoteTable, time_groups: TimeGroups):
+        # A single note is a chord of one, so both cases reduce to the average pitch of the
+        # group's unassigned notes.
+        unassigned = notes.hand == HAND_UNKNOWN
+        unassigned_count = np.add.reduceat(unassigned.astype(np.int64), time_groups.firsts)
+        unassigned_pitch_sum = np.add.reduceat(np.where(unassigned, notes.pitch, 0).astype(np.int64), time_groups.firsts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_pitch = unassigned_pitch_sum / unassigned_count
+        group_hand = np.where(avg_pitch < 60, HAND_LEFT, HAND_RIGHT).astype(np.int8)
+        notes.hand[unassigned] = group_hand[time_groups.group_ids()][unassigned]
+
+    def _assign_by_beam_search(self, notes: NoteTable, time_groups: TimeGroups):
+        unassigned = notes.hand == HAND_UNKNOWN
+        if not unassigned.any(): return
+        group_ids = time_groups.group_ids()
+        # Unassigned notes of each group in pitch order; option k gives the first k to the left hand.
+        order = np.flatnonzero(unassigned)
+        order = order[np.lexsort((notes.pitch[order], group_ids[order]))]
+        split_offsets = np.searchsorted(group_ids[order], np.arange(len(time_groups) + 1)).tolist()
+        options = self._split_options(notes, time_groups, order)
+        _, splits = self._search(options, notes.start[time_groups.firsts].tolist())
+        hands = notes.hand
+        for g, split in enumerate(splits):
+            lo, hi = split_offsets[g], split_offsets[g + 1]
+            hands[order[lo:lo + split]] = HAND_LEFT
+            hands[order[lo + split:hi]] = HAND_RIGHT
 
-    def assign_hands(self, notes: List[Note]):
-        time_groups = get_time_groups(notes)
-        for group in time_groups:
-            if len(group) == 1: self._assign_single_note(group[0])
-            else: self._assign_chord(group)
+    def assignment_cost(self, notes: NoteTable, time_groups: Optional[TimeGroups] = None) -> float:
+        # Cost of the current hand assignment under the beam search's model.
+        if time_groups is None: time_groups = TimeGroups.build(notes.start)
+        options = self._split_options(notes, time_groups, np.empty(0, dtype=np.int64))
+        return self._search(options, notes.start[time_groups.firsts].tolist())[0]
 
-    def _assign_single_note(self, note: Note):
-        if note.hand != 'unknown': return
-        note.hand = 'left' if note.pitch < 60 else 'right'
+    def _search(self, options: List[List[Tuple[int, int, int, int, float]]], times: List[float]) -> Tuple[float, List[int]]:
+        travel_weight, recency_weight, stretch_weight = self.TRAVEL_WEIGHT, self.RECENCY_WEIGHT, self.STRETCH_WEIGHT
+        max_span, crossover_penalty, beam_width = self.MAX_HAND_SPAN, self.CROSSOVER_PENALTY, self.beam_width
+        left_home, right_home = self.HOME_PITCHES
+        # A state is (cost, left low, left high, left time, right low, right high, right time, choices),
+        # with choices a (split, previous choices) chain for the backtrace.
+        beam = [(0.0, left_home, left_home, -1.0, right_home, right_home, -1.0, None)]
+        for t, group_options in zip(times, options):
+            candidates = {}
+            for cost, llo, lhi, lt, rlo, rhi, rt, choices in beam:
+                for split, (alo, ahi, blo, bhi, static_cost) in enumerate(group_options):
+                    total = cost + static_cost
+                    nllo, nlhi, nlt, nrlo, nrhi, nrt = llo, lhi, lt, rlo, rhi, rt
+                    if alo >= 0:
+                        total += travel_weight * abs((alo + ahi - llo - lhi) * 0.5)
+                        reach = (ahi if ahi > lhi else lhi) - (alo if alo < llo else llo)
+                        if reach > max_span:
+                            total += (reach - max_span) * stretch_weight
+                            if 1e-6 < t - lt < 0.5: total += recency_weight / (t - lt)
+                        nllo, nlhi, nlt = alo, ahi, t
+                    if blo >= 0:
+                        total += travel_weight * abs((blo + bhi - rlo - rhi) * 0.5)
+                        reach = (bhi if bhi > rhi else rhi) - (blo if blo < rlo else rlo)
+                        if reach > max_span:
+                            total += (reach - max_span) * stretch_weight
+                            if 1e-6 < t - rt < 0.5: total += recency_weight / (t - rt)
+                        nrlo, nrhi, nrt = blo, bhi, t
+                    if nllo + nlhi > nrlo + nrhi: total += crossover_penalty
+                    key = (nllo, nlhi, nlt, nrlo, nrhi, nrt)
+                    best = candidates.get(key)
+                    if best is None or total < best[0]:
+                        candidates[key] = (total, nllo, nlhi, nlt, nrlo, nrhi, nrt, (split, choices))
+            beam = list(candidates.values())
+            if len(beam) > beam_width: beam = sorted(beam, key=_state_cost)[:beam_width]
 
-    def _assign_chord(self, chord_notes: List[Note]):
-        unassigned = [n for n in chord_notes if n.hand == 'unknown']
-        if not unassigned: return
-        avg_pitch = sum(n.pitch for n in unassigned) / len(unassigned)
-        hand = 'left' if avg_pitch < 60 else 'right'
-        for n in unassigned: n.hand = hand
+        best = min(beam, key=_state_cost)
+        splits = [0] * len(options)
+        choices = best[7]
+        for g in range(len(options) - 1, -1, -1):
+            splits[g], choices = choices
+        return best[0], splits
+
+    def _split_options(self, notes: NoteTable, time_groups: TimeGroups, order: np.ndarray) -> List[List[Tuple[int, int, int, int, float]]]:
+        # Per group and split: (left low, left high, right low, right high, state-free cost); -1 marks an idle hand.
+        firsts, group_count = time_groups.firsts, len(time_groups)
+        pitches = notes.pitch.astype(np.int64)
+        is_left, is_right = notes.hand == HAND_LEFT, notes.hand == HAND_RIGHT
+        fixed_left_count = np.add.reduceat(is_left.astype(np.int64), firsts)
+        fixed_right_count = np.add.reduceat(is_right.astype(np.int64), firsts)
+        fixed_left_lo = np.minimum.reduceat(np.where(is_left, pitches, 128), firsts)
+        fixed_left_hi = np.maximum.reduceat(np.where(is_left, pitches, -1), firsts)
+        fixed_right_lo = np.minimum.reduceat(np.where(is_right, pitches, 128), firsts)
+        fixed_right_hi = np.maximum.reduceat(np.where(is_right, pitches, -1), firsts)
+
+        # One row per (group, split); free notes are in pitch order, so each side's edges are single lookups.
+        free_count = np.bincount(time_groups.group_ids()[order], minlength=group_count)
+        free_first = np.concatenate([[0], np.cumsum(free_count)[:-1]])
+        free_pitches = np.append(pitches[order], 0)
+        group = np.repeat(np.arange(group_count), free_count + 1)
+        option_offsets = np.concatenate([[0], np.cumsum(free_count + 1)])
+        split = np.arange(len(group)) - option_offsets[group]
+        first, count = free_first[group], free_count[group]
+        free_left_lo = np.where(split > 0, free_pitches[first], 128)
+        free_left_hi = np.where(split > 0, free_pitches[first + np.maximum(split - 1, 0)], -1)
+        free_right_lo = np.where(split < count, free_pitches[first + np.minimum(split, np.maximum(count - 1, 0))], 128)
+        free_right_hi = np.where(split < count, free_pitches[first + np.maximum(count - 1, 0)], -1)
+
+        left_count, right_count = fixed_left_count[group] + split, fixed_right_count[group] + count - split
+        alo, ahi = np.minimum(fixed_left_lo[group], free_left_lo), np.maximum(fixed_left_hi[group], free_left_hi)
+        blo, bhi = np.minimum(fixed_right_lo[group], free_right_lo), np.maximum(fixed_right_hi[group], free_right_hi)
+        has_left, has_right = left_count > 0, right_count > 0
+        black = np.isin(np.arange(129) % 12, [1, 3, 6, 8, 10])
+        cost = (self.UNREACHABLE_CHORD_PENALTY * ((has_left & (ahi - alo > self.MAX_HAND_SPAN)).astype(np.float64) +
+                                                  (has_right & (bhi - blo > self.MAX_HAND_SPAN)))
+                + self.CROSSOVER_PENALTY * (has_left & has_right & (ahi > blo))
+                # The thumb takes the inner edge of a chord: the top of the left hand, the bottom of the right.
+                + self.THUMB_ON_BLACK_KEY_PENALTY * ((left_count > 1) & black[np.maximum(ahi, 0)]).astype(np.float64)
+                + self.THUMB_ON_BLACK_KEY_PENALTY * ((right_count > 1) & black[np.minimum(blo, 128)]))
+        rows = list(zip(np.where(has_left, alo, -1).tolist(), np.where(has_left, ahi, -1).tolist(),
+                        np.where(has_right, blo, -1).tolist(), np.where(has_right, bhi, -1).tolist(), cost.tolist()))
+        bounds = option_offsets.tolist()
+        return [rows[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+def _concat_ranges(lo: np.ndarray, hi: np.ndarray):
+    # Index selecting the runs [lo[i], hi[i]) back to back; a plain slice when they touch.
+    if not len(lo): return slice(0, 0)
+    if np.array_equal(hi[:-1], lo[1:]): return slice(int(lo[0]), int(hi[-1]))
+    lengths = hi - lo
+    return np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
 
 class SectionAnalyzer:
-    def __init__(self, notes: List[Note], tempo_map: TempoMap):
-        self.notes = sorted(notes, key=lambda n: n.start_time)
+    def __init__(self, notes: NoteTable, tempo_map: TempoMap, note_beats: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        # note_beats, from SectionAnalyzer.note_beats, only depend on timing and may be shared across hand assignments.
+        self.source = notes
         self.tempo_map = tempo_map
+        self.source_beats = note_beats
+
+    @staticmethod
+    def note_beats(notes: NoteTable, tempo_map: TempoMap) -> Tuple[np.ndarray, np.ndarray]:
+        return tempo_map.times_to_beats(notes.start), tempo_map.times_to_beats(notes.end)
 
     def analyze(self) -> List[MusicalSection]:
-        if not self.notes: return []
+        # Sorted on every run, so hand edits to the source table since construction are seen.
+        order = None if self.source.is_sorted_by_start() else self.source.start_order()
+        self.notes = self.source if order is None else self.source[order]
+        if not len(self.notes): return []
+        beats = self.source_beats or SectionAnalyzer.note_beats(self.source, self.tempo_map)
+        self.beats = beats if order is None else (beats[0][order], beats[1][order])
         if self.tempo_map.has_explicit_time_signatures:
             return self._analyze_by_measures()
         else:
             return self._analyze_by_silence()
 
     def _analyze_by_silence(self) -> List[MusicalSection]:
-        boundaries = self._detect_grand_pauses()
+        boundaries = np.asarray(self._detect_grand_pauses())
+        lo, hi = boundaries[:-1], boundaries[1:]
+        lo, hi = lo[hi > lo], hi[hi > lo]
+        articulations = self._classify_bass_articulations(lo, hi)
         sections = []
-        for i in range(len(boundaries) - 1):
-            start_idx = boundaries[i]
-            end_idx = boundaries[i+1] - 1
-            if start_idx > end_idx: continue
-            sec_notes = self.notes[start_idx : end_idx+1]
-            if not sec_notes: continue
-            start_time = sec_notes[0].start_time
-            end_time = max(n.end_time for n in sec_notes)
+        for start_idx, end_idx, articulation in zip(lo.tolist(), hi.tolist(), articulations):
+            sec_notes = self.notes[start_idx:end_idx]
+            start_time = float(sec_notes.start[0])
+            end_time = float(sec_notes.end.max())
             start_beat = self.tempo_map.time_to_beat(start_time)
             end_beat = self.tempo_map.time_to_beat(end_time)
-            articulation = self._classify_bass_articulation(sec_notes)
             pace = self._classify_pace_beats(sec_notes, start_beat, end_beat)
             sections.append(MusicalSection(start_time, end_time, sec_notes, articulation, pace, start_beat, end_beat))
         return sections
 
     def _analyze_by_measures(self) -> List[MusicalSection]:
-        total_dur = max(n.end_time for n in self.notes)
-        measures = self.tempo_map.get_measure_boundaries(total_dur)
+        grid = self.tempo_map.measure_grid(float(self.notes.end.max()))
+        # Starts are sorted, so every measure owns one contiguous run [lo, hi) of notes.
+        lo = np.searchsorted(self.notes.start, grid.start_times, side='left')
+        hi = np.searchsorted(self.notes.start, grid.end_times, side='left')
+        start_beats = self.tempo_map.times_to_beats(grid.start_times)
+        end_beats = self.tempo_map.times_to_beats(grid.end_times)
+        paces = self._classify_paces(hi - lo, start_beats, end_beats)
+        styles = self._classify_bass_articulations(lo, hi)
         sections = []
-        current_section_start = measures[0][0] if measures else 0
-        current_notes_in_section = []
+        first = 0
         prev_style = None
         prev_pace = None
-        
-        def classify_chunk(chunk_notes, s_time, e_time):
-            s_beat = self.tempo_map.time_to_beat(s_time)
-            e_beat = self.tempo_map.time_to_beat(e_time)
-            art = self._classify_bass_articulation(chunk_notes)
-            pace = self._classify_pace_beats(chunk_notes, s_beat, e_beat)
-            return art, pace
-
-        for i, (m_start, m_end) in enumerate(measures):
-            notes_in_measure = [n for n in self.notes if n.start_time >= m_start and n.start_time < m_end]
-            if not notes_in_measure:
-                style, pace = (prev_style or 'legato'), (prev_pace or 'normal')
+
+        def close_section(stop: int, end_time: float, end_beat: float):
+            sec_notes = self.notes[_concat_ranges(lo[first:stop], hi[first:stop])]
+            if not len(sec_notes): return
+            sections.append(MusicalSection(float(grid.start_times[first]), end_time, sec_notes, prev_style, prev_pace,
+                                           float(start_beats[first]), end_beat))
+
+        for i in range(len(grid)):
+            if hi[i] > lo[i]:
+                style, pace = styles[i], paces[i]
             else:
-                style, pace = classify_chunk(notes_in_measure, m_start, m_end)
+                style, pace = (prev_style or 'legato'), (prev_pace or 'normal')
             if prev_style is None:
                 prev_style = style
                 prev_pace = pace
-                current_notes_in_section.extend(notes_in_measure)
                 continue
             if style != prev_style:
-                if current_notes_in_section:
-                    sec_end = m_start 
-                    s_beat = self.tempo_map.time_to_beat(current_section_start)
-                    e_beat = self.tempo_map.time_to_beat(sec_end)
-                    sections.append(MusicalSection(current_section_start, sec_end, list(current_notes_in_section), prev_style, prev_pace, s_beat, e_beat))
-                current_section_start = m_start
-                current_notes_in_section = []
+                close_section(i, float(grid.start_times[i]), float(start_beats[i]))
+                first = i
                 prev_style = style
                 prev_pace = pace
-            current_notes_in_section.extend(notes_in_measure)
-            
-        if current_notes_in_section:
-            sec_end = measures[-1][1]
-            s_beat = self.tempo_map.time_to_beat(current_section_start)
-            e_beat = self.tempo_map.time_to_beat(sec_end)
-            sections.append(MusicalSection(current_section_start, sec_end, list(current_notes_in_section), prev_style, prev_pace, s_beat, e_beat))
+        if len(grid): close_section(len(grid), float(grid.end_times[-1]), float(end_beats[-1]))
         return sections
 
     def _detect_grand_pauses(self) -> List[int]:
-        indices = [0]
-        if not self.notes: return indices
-        last_end_time = self.notes[0].end_time
-        for i in range(1, len(self.notes)):
-            current_start = self.notes[i].start_time
-            gap_sec = current_start - last_end_time
-            tempo = self.tempo_map.get_tempo_at(last_end_time)
-            sec_per_beat = tempo / 1_000_000.0
-            gap_beats = gap_sec / sec_per_beat
-            if gap_beats > 2.0:
-                indices.append(i)
-            last_end_time = max(last_end_time, self.notes[i].end_time)
-        indices.append(len(self.notes))
-        return indices
-
-    def _classify_bass_articulation(self, notes: List[Note]) -> str:
-        lh_notes = [n for n in notes if n.hand == 'left']
-        if len(lh_notes) < 2: return 'legato'
-        total_overlap = 0.0
-        total_possible = 0.0
-        lh_notes.sort(key=lambda n: n.start_time)
-        for i in range(len(lh_notes) - 1):
-            curr = lh_notes[i]
-            next_n = lh_notes[i+1]
-            curr_beat = self.tempo_map.time_to_beat(curr.start_time)
-            next_beat = self.tempo_map.time_to_beat(next_n.start_time)
-            ioi_beats = next_beat - curr_beat
-            if ioi_beats <= 0: continue
-            dur_beats = self.tempo_map.time_to_beat(curr.end_time) - curr_beat
-            ratio = dur_beats / ioi_beats
-            total_overlap += min(ratio, 1.2)
-            total_possible += 1.0
-        if total_possible == 0: return 'legato'
-        avg_ratio = total_overlap / total_possible
-        if avg_ratio >= 0.95: return 'legato'
-        if avg_ratio <= 0.60: return 'staccato'
-        return 'hybrid'
-
-    def _classify_pace_beats(self, notes: List[Note], start_beat: float, end_beat: float) -> str:
+        if not len(self.notes): return [0]
+        # Gap from each note's start back to the latest end of everything before it, measured in beats at that end.
+        last_end = np.maximum.accumulate(self.notes.end)[:-1]
+        gap_sec = self.notes.start[1:] - last_end
+        sec_per_beat = self.tempo_map.tempos_at(last_end) / 1_000_000.0
+        pauses = np.flatnonzero(gap_sec / sec_per_beat > 2.0) + 1
+        return [0] + pauses.tolist() + [len(self.notes)]
+
+    def _bass_pair_ratios(self):
+        # Duration / inter-onset ratio, in beats, of every consecutive pair of left-hand notes in the song.
+        # A section's bass line is a contiguous run of these pairs, so prefix counts locate it.
+        start_beats, end_beats = self.beats
+        is_left = self.notes.hand == HAND_LEFT
+        left = np.flatnonzero(is_left)
+        lh_start, lh_end = start_beats[left], end_beats[left]
+        ioi = lh_start[1:] - lh_start[:-1]
+        valid = ioi > 0
+        ratios = np.minimum((lh_end[:-1] - lh_start[:-1])[valid] / ioi[valid], 1.2)
+        left_before = np.concatenate(([0], np.cumsum(is_left)))
+        valid_before = np.concatenate(([0], np.cumsum(valid)))
+        return left_before, valid_before, ratios, np.concatenate(([0.0], np.cumsum(ratios)))
+
+    def _classify_bass_articulations(self, lo: np.ndarray, hi: np.ndarray) -> List[str]:
+        # Left-hand articulation over each note range [lo[i], hi[i]).
+        left_before, valid_before, ratios, ratio_sums = self._bass_pair_ratios()
+        first, last = left_before[lo], left_before[hi]
+        # Pairs (j, j + 1) with first <= j < last - 1.
+        top = len(valid_before) - 1
+        k0 = valid_before[np.minimum(first, top)]
+        k1 = valid_before[np.clip(last - 1, 0, top)]
+        counts = np.where(last - first >= 2, k1 - k0, 0)
+        totals = ratio_sums[k1] - ratio_sums[k0]
+        averages = totals / np.maximum(counts, 1)
+        # Prefix sums round differently from adding the ratios up one by one, which only matters right at a threshold.
+        near = np.flatnonzero((counts > 0) & ((np.abs(averages - 0.95) < 1e-6) | (np.abs(averages - 0.60) < 1e-6)))
+        for i in near.tolist():
+            total = 0.0
+            for ratio in ratios[k0[i]:k1[i]].tolist(): total += ratio
+            averages[i] = total / counts[i]
+        labels = np.where(averages >= 0.95, 'legato', np.where(averages <= 0.60, 'staccato', 'hybrid'))
+        return np.where(counts == 0, 'legato', labels).tolist()
+
+    @staticmethod
+    def _classify_paces(counts: np.ndarray, start_beats: np.ndarray, end_beats: np.ndarray) -> List[str]:
+        duration_beats = end_beats - start_beats
+        npb = counts / np.where(duration_beats > 0, duration_beats, 1.0)
+        paces = np.where(npb > 3.5, 'fast', np.where(npb < 1.0, 'slow', 'normal'))
+        return np.where(duration_beats <= 0, 'normal', paces).tolist()
+
+    def _classify_pace_beats(self, notes: NoteTable, start_beat: float, end_beat: float) -> str:
         duration_beats = end_beat - start_beat
         if duration_beats <= 0: return 'normal'
         npb = len(notes) / duration_beats
@@ -217,115 +397,117 @@ class SectionAnalyzer:
 
 class PedalGenerator:
     @staticmethod
-    def generate_events(config: Dict, final_notes: List[Note], sections: List[MusicalSection], debug_log: Optional[List[str]] = None) -> List[KeyEvent]:
+    def generate_events(config: Dict, final_notes: NoteOverlay, sections: List[MusicalSection], debug_log: Optional[List[str]] = None) -> List[KeyEvent]:
         style = config.get('pedal_style')
         if style == 'none': return []
         events = []
         
         if style == 'hybrid':
-            bass_notes = [n for n in final_notes if n.hand == 'left']
-            bass_notes.sort(key=lambda n: n.start_time)
-            if not bass_notes:
-                treble_notes = [n for n in final_notes if n.hand == 'right']
-                treble_notes.sort(key=lambda n: n.start_time)
+            bass_notes = final_notes.of_hand(HAND_LEFT).sorted_by_start()
+            if not len(bass_notes):
+                treble_notes = final_notes.of_hand(HAND_RIGHT).sorted_by_start()
                 # Pass both the driver notes and the total track notes
                 return PedalGenerator._generate_adaptive_pedal_driver(treble_notes, final_notes)
             # Pass both the driver notes and the total track notes
             return PedalGenerator._generate_adaptive_pedal_driver(bass_notes, final_notes)
             
-        for section in sections:
-            lh_notes = [n for n in section.notes if n.hand == 'left']
-            lh_notes.sort(key=lambda n: n.start_time)
-            if not lh_notes: 
-                start = section.notes[0].start_time
-                end = max(n.end_time for n in section.notes)
+        section_lh_notes = [section.notes.of_hand(HAND_LEFT).sorted_by_start() for section in sections]
+        if style == 'rhythmic':
+            # Group every section's left hand in one pass; section boundaries always open a new group.
+            lh_all = NoteTable.concatenate(section_lh_notes)
+            section_offsets = np.cumsum([0] + [len(lh) for lh in section_lh_notes])
+            time_groups = TimeGroups.build(lh_all.start, breaks=section_offsets[:-1])
+            group_starts = lh_all.start[time_groups.firsts].tolist() if len(lh_all) else []
+            group_ends = np.maximum.reduceat(lh_all.end, time_groups.firsts).tolist() if len(lh_all) else []
+            section_first_group = np.searchsorted(time_groups.firsts, section_offsets).tolist()
+
+        for i, section in enumerate(sections):
+            lh_notes = section_lh_notes[i]
+            if not len(lh_notes): 
+                start = float(section.notes.start[0])
+                end = float(section.notes.end.max())
                 events.append(KeyEvent(start, 1, 'pedal', 'down'))
                 events.append(KeyEvent(end, 0, 'pedal', 'up'))
                 continue
                 
             if style == 'rhythmic':
-                groups = get_time_groups(lh_notes)
-                for g in groups:
-                    start = g[0].start_time
-                    end = max(n.end_time for n in g)
-                    events.append(KeyEvent(start, 1, 'pedal', 'down'))
-                    events.append(KeyEvent(end, 0, 'pedal', 'up'))
+                for g in range(section_first_group[i], section_first_group[i + 1]):
+                    events.append(KeyEvent(group_starts[g], 1, 'pedal', 'down'))
+                    events.append(KeyEvent(group_ends[g], 0, 'pedal', 'up'))
             else:
                 PedalGenerator._generate_harmonic_pedal(events, lh_notes)
         return events
 
     @staticmethod
-    def _generate_adaptive_pedal_driver(driver_notes: List[Note], all_notes: List[Note]) -> List[KeyEvent]:
+    def _generate_adaptive_pedal_driver(driver_notes: NoteOverlay, all_notes: NoteOverlay) -> List[KeyEvent]:
         events = []
-        if not driver_notes: return events
+        if not len(driver_notes): return events
         
         PEDAL_LAG = 0.05 
         SAFE_INTERVALS = {0, 3, 4, 5, 7} # Unison, minor 3rd, Major 3rd, Perfect 4th, Perfect 5th, Octave
         UNSAFE_INTERVALS = {1, 6} # minor 2nd, Tritone
 
-        for i in range(len(driver_notes)):
-            curr = driver_notes[i]
-            next_n = driver_notes[i+1] if i < len(driver_notes) - 1 else None
+        starts, ends, pitches = driver_notes.start.tolist(), driver_notes.end.tolist(), driver_notes.pitch.tolist()
+        # Vertical check for every next driver note at once: a concurrent note a minor 2nd or tritone
+        # above the lowest concurrent pitch (mod 12) makes the change unsafe.
+        concurrency = ConcurrencyIndex(all_notes.start, all_notes.pitch)
+        lo, hi = concurrency.window(driver_notes.start[1:], 0.05)
+        lowest = concurrency.min_pitch(lo, hi)
+        vertical_unsafe = (hi > lo) & (concurrency.has_pitch_class(lo, hi, (lowest + 1) % 12) |
+                                       concurrency.has_pitch_class(lo, hi, (lowest + 6) % 12))
+        vertical_unsafe = vertical_unsafe.tolist()
+        for i in range(len(starts)):
+            has_next = i < len(starts) - 1
             
             if i == 0:
-                events.append(KeyEvent(curr.start_time, 1, 'pedal', 'down'))
+                events.append(KeyEvent(starts[i], 1, 'pedal', 'down'))
             
             gap = 0.0
-            if next_n:
-                gap = next_n.start_time - curr.end_time
+            if has_next:
+                gap = starts[i+1] - ends[i]
             
             if gap > 0.35: 
-                events.append(KeyEvent(curr.end_time, 0, 'pedal', 'up'))
-                if next_n: 
-                    events.append(KeyEvent(next_n.start_time, 1, 'pedal', 'down'))
+                events.append(KeyEvent(ends[i], 0, 'pedal', 'up'))
+                if has_next: 
+                    events.append(KeyEvent(starts[i+1], 1, 'pedal', 'down'))
             else:
                 should_repedal = False
                 
-                if next_n:
+                if has_next:
                     # 1. Linear Harmonic Check
-                    linear_interval = abs(next_n.pitch - curr.pitch) % 12
+                    linear_interval = abs(pitches[i+1] - pitches[i]) % 12
                     if linear_interval in UNSAFE_INTERVALS:
                         should_repedal = True
                     
-                    # 2. Vertical Harmonic Check
-                    if not should_repedal:
-                        # Isolate all notes occurring within a 0.05s window of the next driver note
-                        concurrent_notes = [n for n in all_notes if abs(n.start_time - next_n.start_time) <= 0.05]
-                        if concurrent_notes:
-                            # Establish the harmonic root for this specific timestamp
-                            lowest_pitch = min(n.pitch for n in concurrent_notes)
-                            
-                            # Evaluate each concurrent note against the local root
-                            for n in concurrent_notes:
-                                vertical_interval = abs(n.pitch - lowest_pitch) % 12
-                                if vertical_interval in UNSAFE_INTERVALS:
-                                    should_repedal = True
-                                    break # Exit early upon first detected dissonance
+                    # 2. Vertical Harmonic Check against the notes within 0.05s of the next driver note
+                    if not should_repedal and vertical_unsafe[i]:
+                        should_repedal = True
                 
-                if should_repedal and next_n:
-                    events.append(KeyEvent(next_n.start_time, 0, 'pedal', 'up'))
-                    events.append(KeyEvent(next_n.start_time + PEDAL_LAG, 1, 'pedal', 'down'))
+                if should_repedal and has_next:
+                    events.append(KeyEvent(starts[i+1], 0, 'pedal', 'up'))
+                    events.append(KeyEvent(starts[i+1] + PEDAL_LAG, 1, 'pedal', 'down'))
                     
-        final_end = max(n.end_time for n in driver_notes)
+        final_end = max(ends)
         events.append(KeyEvent(final_end, 0, 'pedal', 'up'))
         return events
 
     @staticmethod
-    def _generate_harmonic_pedal(events: List[KeyEvent], bass_notes: List[Note]):
-        if not bass_notes: return
+    def _generate_harmonic_pedal(events: List[KeyEvent], bass_notes: NoteTable):
+        if not len(bass_notes): return
         current_bass_pitch = -1
-        for i, note in enumerate(bass_notes):
-            is_new_harmony = (note.pitch != current_bass_pitch)
-            prev_end = bass_notes[i-1].end_time if i > 0 else 0
-            has_gap = (note.start_time - prev_end) > 0.15
+        starts, ends, pitches = bass_notes.start.tolist(), bass_notes.end.tolist(), bass_notes.pitch.tolist()
+        for i, pitch in enumerate(pitches):
+            is_new_harmony = (pitch != current_bass_pitch)
+            prev_end = ends[i-1] if i > 0 else 0
+            has_gap = (starts[i] - prev_end) > 0.15
             if i == 0:
-                events.append(KeyEvent(note.start_time, 1, 'pedal', 'down'))
+                events.append(KeyEvent(starts[i], 1, 'pedal', 'down'))
             elif has_gap:
                 events.append(KeyEvent(prev_end, 0, 'pedal', 'up'))
-                events.append(KeyEvent(note.start_time, 1, 'pedal', 'down'))
+                events.append(KeyEvent(starts[i], 1, 'pedal', 'down'))
             elif is_new_harmony:
-                events.append(KeyEvent(note.start_time, 0, 'pedal', 'up'))
-                events.append(KeyEvent(note.start_time, 1, 'pedal', 'down'))
-            current_bass_pitch = note.pitch
-        final_end = max(n.end_time for n in bass_notes)
+                events.append(KeyEvent(starts[i], 0, 'pedal', 'up'))
+                events.append(KeyEvent(starts[i], 1, 'pedal', 'down'))
+            current_bass_pitch = pitch
+        final_end = max(ends)
         events.append(KeyEvent(final_end, 0, 'pedal', 'up'))
\ No newline at end of file
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+import mido
+import numpy as np
+from core import GlobalTickMap, MidiParser, TimeGroups
+from models import NoteTable, NoteOverlay
+from analysis import Humanizer, FingeringEngine
+from smf import NotePairer
+
+def _timed(func, *args, repeat: int = 3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def _report(title: str, rows):
+    print(f"\n{title}")
+    baseline = rows[0][1]
+    for name, seconds in rows:
+        print(f"  {name:<32} {seconds * 1000:10.2f} ms  {baseline / seconds:8.1f}x")
+
+def _conductor_track(tempo_events: int, rng: random.Random) -> mido.MidiTrack:
+    conductor = mido.MidiTrack()
+    for _ in range(tempo_events):
+        conductor.append(mido.MetaMessage('set_tempo', tempo=rng.randint(400_000, 700_000), time=480))
+    return conductor
+
+def build_tempo_heavy_midi(tempo_events: int = 10_000, notes: int = 20_000, seed: int = 0) -> mido.MidiFile:
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=480)
+    mid.tracks.append(_conductor_track(tempo_events, rng))
+    track = mido.MidiTrack()
+    span = tempo_events * 480
+    step = max(span // notes, 1)
+    for _ in range(notes):
+        pitch = rng.randint(36, 96)
+        track.append(mido.Message('note_on', note=pitch, velocity=80, time=0))
+        track.append(mido.Message('note_off', note=pitch, velocity=0, time=step))
+    mid.tracks.append(track)
+    return mid
+
+def _linear_tick_to_time(global_map: GlobalTickMap, tick: int) -> float:
+    # Reference implementation of the previous full scan of tick_map per lookup.
+    last_tick, last_time, tempo = global_map.tick_map[0]
+    for t_tick, t_time, t_tempo in global_map.tick_map:
+        if tick >= t_tick: last_tick, last_time, tempo = t_tick, t_time, t_tempo
+        else: break
+    return last_time + mido.tick2second(tick - last_tick, global_map.ticks_per_beat, tempo)
+
+def bench_tick_to_time(tempo_events: int = 10_000, notes: int = 20_000):
+    mid = build_tempo_heavy_midi(tempo_events, notes)
+    global_map = GlobalTickMap(mid)
+    ticks = np.cumsum([msg.time for msg in mid.tracks[1]])
+    tick_list = ticks.tolist()
+
+    linear_sample = tick_list[::20]
+    linear_time, linear = _timed(lambda: [_linear_tick_to_time(global_map, t) for t in linear_sample], repeat=1)
+    linear_time *= len(tick_list) / len(linear_sample)
+    bisect_time, scalar = _timed(lambda: [global_map.tick_to_time(t) for t in tick_list])
+    batch_time, batch = _timed(global_map.ticks_to_times, ticks)
+
+    assert np.allclose(scalar[::20], linear, rtol=0, atol=1e-9)
+    assert np.allclose(batch, scalar, rtol=0, atol=1e-9)
+    _report(f"tick -> seconds: {len(tick_list)} ticks, {len(global_map.tick_map)} tempo entries", [
+        ("linear scan (extrapolated)", linear_time),
+        ("bisect per tick", bisect_time),
+        ("np.searchsorted batch", batch_time),
+    ])
+
+def build_dense_midi(tracks: int = 8, notes_per_track: int = 50_000, seed: int = 0) -> mido.MidiFile:
+    rng = random.Random(seed)
+    mid = mido.MidiFile(ticks_per_beat=480)
+    mid.tracks.append(_conductor_track(100, rng))
+    for channel in range(tracks):
+        track = mido.MidiTrack([mido.MetaMessage('track_name', name=f"Part {channel}"), mido.Message('program_change', channel=channel, program=channel)])
+        for _ in range(notes_per_track):
+            pitch = rng.randint(21, 108)
+            track.append(mido.Message('note_on', channel=channel, note=pitch, velocity=rng.randint(30, 120), time=rng.randint(0, 60)))
+            track.append(mido.Message('note_off', channel=channel, note=pitch, velocity=0, time=rng.randint(10, 240)))
+        mid.tracks.append(track)
+    return mid
+
+def _peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _parse_with_mido(path: str):
+    track_events, global_map = MidiParser._read_with_mido(path)
+    pairer = NotePairer()
+    return MidiParser._build_tracks([(events, pairer.pair(events)) for events in track_events], global_map, 1.0)
+
+def bench_parse(tracks: int = 8, notes_per_track: int = 50_000):
+    workers = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/dense.mid"
+        build_dense_midi(tracks, notes_per_track).save(path)
+        mido_time, (slow_tracks, _) = _timed(_parse_with_mido, path, repeat=1)
+        fast_time, (fast_tracks, _) = _timed(MidiParser.parse_structure, path, 1.0, None, 'fifo', 1)
+        parallel_time, (parallel_tracks, _) = _timed(MidiParser.parse_structure, path, 1.0, None, 'fifo', workers)
+        mido_peak = _peak_memory(_parse_with_mido, path)
+        fast_peak = _peak_memory(MidiParser.parse_structure, path, 1.0, None, 'fifo', 1)
+        size = os.path.getsize(path)
+
+    for slow, fast, parallel in zip(slow_tracks, fast_tracks, parallel_tracks):
+        assert np.array_equal(slow.table.pitch, fast.table.pitch)
+        assert np.allclose(slow.table.start, fast.table.start, rtol=0, atol=1e-9)
+        assert np.array_equal(fast.table.data, parallel.table.data)
+    _report(f"parse: {size / 1e6:.1f} MB, {tracks * notes_per_track} notes", [
+        (f"mido.MidiFile ({mido_peak / 1e6:.0f} MB peak)", mido_time),
+        (f"mmap SMF decoder ({fast_peak / 1e6:.0f} MB peak)", fast_time),
+        (f"mmap SMF decoder, {workers} processes", parallel_time),
+    ])
+
+HUMANIZE_CONFIG = {'vary_timing': True, 'timing_variance': 0.01, 'vary_articulation': True, 'articulation': 0.95,
+                   'enable_drift_correction': True, 'drift_decay_factor': 0.25, 'enable_chord_roll': True, 'humanize_seed': 0}
+
+def _loop_humanize(starts, durations, pitches, time_groups: TimeGroups, resync_points, config):
+    # Reference implementation of the previous per-group loop, fed the same seeded draws.
+    rng = np.random.default_rng(config['humanize_seed'])
+    sigma = config['timing_variance']
+    offsets = np.clip(rng.normal(0.0, sigma, len(time_groups)), -3 * sigma, 3 * sigma).tolist()
+    articulation = (config['articulation'] - rng.random(len(time_groups)) * 0.1).tolist()
+    resync, drift = set(resync_points.tolist()), 0.0
+    for g, ((lo, hi), first_start) in enumerate(zip(time_groups.ranges(), starts[time_groups.firsts].tolist())):
+        if round(first_start, 2) in resync: drift *= config['drift_decay_factor']
+        if hi - lo > 1: starts[lo + np.argsort(pitches[lo:hi], kind='stable')] += np.arange(hi - lo) * 0.006
+        starts[lo:hi] += offsets[g] + drift
+        durations[lo:hi] = np.maximum(durations[lo:hi] * articulation[g], 0.03)
+        drift += offsets[g]
+
+def bench_humanize(notes: int = 100_000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    starts = np.sort(np.round(rng.uniform(0, notes / 60, notes), 2))
+    table = NoteTable.from_columns(np.arange(notes), rng.integers(21, 109, notes), np.full(notes, 80), starts, rng.uniform(0.05, 1.0, notes))
+    time_groups = TimeGroups.build(table.start)
+    resync_points = np.unique(np.round(starts[::3], 2))
+
+    def vectorized():
+        overlay = NoteOverlay(table)
+        Humanizer(HUMANIZE_CONFIG).apply_to_hand(overlay, 'left', resync_points, time_groups)
+        return overlay
+    def loop():
+        overlay = NoteOverlay(table)
+        _loop_humanize(overlay.start, overlay.duration, table.pitch, time_groups, resync_points, HUMANIZE_CONFIG)
+        return overlay
+    loop_time, reference = _timed(loop, repeat=1)
+    vector_time, result = _timed(vectorized)
+
+    assert np.allclose(result.start, reference.start, rtol=0, atol=1e-9)
+    assert np.allclose(result.duration, reference.duration, rtol=0, atol=1e-12)
+    _report(f"humanize one hand: {notes} notes, {len(time_groups)} groups", [
+        ("per-group loop", loop_time),
+        ("vectorized Generator draws", vector_time),
+    ])
+
+def bench_hands(tracks: int = 2, notes_per_track: int = 50_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/dense.mid"
+        build_dense_midi(tracks, notes_per_track).save(path)
+        song_tracks, _ = MidiParser.parse_structure(path)
+    notes = NoteTable.concatenate([track.table for track in song_tracks])
+    notes = notes[notes.start_order()]
+    time_groups = TimeGroups.build(notes.start)
+    scorer = FingeringEngine()
+
+    rows, costs = [], []
+    for beam_width in (0, 1, 4, 8, 16):
+        assigned = notes.copy()
+        seconds, _ = _timed(FingeringEngine(beam_width).assign_hands, assigned, time_groups, repeat=1)
+        costs.append(scorer.assignment_cost(assigned, time_groups))
+        name = "average pitch split" if beam_width == 0 else f"beam search, width {beam_width}"
+        rows.append((f"{name} (cost {costs[-1]:,.0f})", seconds))
+    assert min(costs[1:]) <= costs[0]
+    _report(f"hand assignment: {len(notes)} notes, {len(time_groups)} groups", rows)
+
+BENCHMARKS = {
+    'tick_to_time': bench_tick_to_time,
+    'parse': bench_parse,
+    'humanize': bench_humanize,
+    'hands': bench_hands,
+}
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        BENCHMARKS[name]()
@@ -0,0 +1,174 @@
+import os
+import json
+import hashlib
+import time
+import numpy as np
+from collections import OrderedDict
+from dataclasses import replace
+from pathlib import Path
+from typing import List, Tuple, Optional, Sequence
+from models import MidiTrack, TrackInfo, NoteTable, NOTE_DTYPE
+from core import MidiParser, TempoMap
+
+class DiskCache:
+    FORMAT_VERSION = 1
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def content_hash(filepath: str) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def selection_key(digest: str, tracks: Optional[Tuple[int, ...]]) -> str:
+        if tracks is None: return digest
+        return f"{digest}-{hashlib.blake2b(repr(tracks).encode(), digest_size=8).hexdigest()}"
+
+    def _paths(self, digest: str) -> Tuple[Path, Path]:
+        return self.cache_dir / f"{digest}.npy", self.cache_dir / f"{digest}.json"
+
+    def load(self, digest: str) -> Optional[Tuple[List[MidiTrack], TempoMap]]:
+        notes_path, meta_path = self._paths(digest)
+        if not (notes_path.exists() and meta_path.exists()): return None
+        try:
+            with open(meta_path, 'r') as f: meta = json.load(f)
+            if meta.get('version') != self.FORMAT_VERSION: return None
+            notes = np.load(notes_path, mmap_mode='r')
+            if notes.dtype != NOTE_DTYPE: return None
+            tracks = [MidiTrack(t['index'], t['name'], t['program_change'], t['is_drum'], NoteTable(notes[t['offset']:t['offset'] + t['count']]))
+                      for t in meta['tracks']]
+            tempo_map = TempoMap([tuple(e) for e in meta['tempo_events']], [tuple(ts) for ts in meta['time_signatures']])
+        except Exception:
+            self._remove(digest)
+            return None
+        now = time.time()
+        for path in (notes_path, meta_path): os.utime(path, (now, now))
+        return tracks, tempo_map
+
+    def store(self, digest: str, tracks: List[MidiTrack], tempo_map: TempoMap):
+        notes_path, meta_path = self._paths(digest)
+        track_meta, offset = [], 0
+        for track in tracks:
+            track_meta.append({'index': track.index, 'name': track.name, 'program_change': track.program_change,
+                               'is_drum': track.is_drum, 'offset': offset, 'count': track.note_count})
+            offset += track.note_count
+        meta = {
+            'version': self.FORMAT_VERSION,
+            'tracks': track_meta,
+            'tempo_events': [list(e) for e in tempo_map.events],
+            'time_signatures': [list(ts) for ts in tempo_map.time_signatures],
+        }
+        notes = NoteTable.concatenate([track.table for track in tracks]).data
+        try:
+            tmp_notes = notes_path.with_suffix('.npy.tmp')
+            with open(tmp_notes, 'wb') as f: np.save(f, notes)
+            os.replace(tmp_notes, notes_path)
+            tmp_meta = meta_path.with_suffix('.json.tmp')
+            with open(tmp_meta, 'w') as f: json.dump(meta, f)
+            os.replace(tmp_meta, meta_path)
+        except Exception as e:
+            print(f"Error writing song cache: {e}")
+            self._remove(digest)
+            return
+        self._evict()
+
+    def _remove(self, digest: str) -> bool:
+        # The .npy goes first: while it is still memory-mapped (Windows) or the directory is read-only,
+        # the entry is left whole for a later eviction.
+        for path in self._paths(digest):
+            try: path.unlink()
+            except FileNotFoundError: pass
+            except OSError: return False
+        return True
+
+    def _evict(self):
+        entries, total = [], 0
+        for meta_path in self.cache_dir.glob('*.json'):
+            notes_path = meta_path.with_suffix('.npy')
+            try:
+                size = meta_path.stat().st_size + (notes_path.stat().st_size if notes_path.exists() else 0)
+                entries.append((meta_path.stat().st_mtime, meta_path.stem, size))
+            except OSError: continue
+            total += size
+        entries.sort()
+        for _, digest, size in entries:
+            if total <= self.max_bytes: break
+            if self._remove(digest): total -= size
+
+class SongCache:
+    MAX_ENTRIES = 4
+
+    def __init__(self, disk_cache: Optional[DiskCache] = None):
+        self.disk_cache = disk_cache
+        self._entries: OrderedDict = OrderedDict()
+        self._scans: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(filepath: str) -> Tuple[str, int, int]:
+        stat = os.stat(filepath)
+        return os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size
+
+    def load(self, filepath: str, tempo_scale: float = 1.0, tracks: Optional[Sequence[int]] = None) -> Tuple[List[MidiTrack], TempoMap]:
+        selection = None if tracks is None else tuple(sorted(set(tracks)))
+        key = self._key(filepath) + (selection,)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load_uncached(filepath, selection)
+            self._entries[key] = entry
+            while len(self._entries) > self.MAX_ENTRIES: self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        song_tracks, tempo_map = entry
+        if tempo_scale == 1.0: return song_tracks, tempo_map
+        scaled_tracks = [replace(track, table=track.table.scaled(tempo_scale)) for track in song_tracks]
+        return scaled_tracks, tempo_map.scaled(tempo_scale)
+
+    def scan(self, filepath: str) -> Tuple[List[TrackInfo], TempoMap]:
+        key = self._key(filepath)
+        entry = self._scans.get(key)
+        if entry is None:
+            entry = MidiParser.scan_metadata(filepath)
+            self._scans[key] = entry
+            while len(self._scans) > self.MAX_ENTRIES: self._scans.popitem(last=False)
+        else:
+            self._scans.move_to_end(key)
+        return entry
+
+    def _load_uncached(self, filepath: str, selection: Optional[Tuple[int, ...]]) -> Tuple[List[MidiTrack], TempoMap]:
+        if self.disk_cache is None:
+            self.misses += 1
+            return MidiParser.parse_structure(filepath, 1.0, tracks=selection)
+        # The disk cache is only an accelerator: any I/O failure there falls back to parsing.
+        try:
+            digest = self.disk_cache.selection_key(self.disk_cache.content_hash(filepath), selection)
+            entry = self.disk_cache.load(digest)
+        except OSError as e:
+            print(f"Error reading song cache: {e}")
+            digest, entry = None, None
+        if entry is not None:
+            self.disk_hits += 1
+            return entry
+        self.misses += 1
+        entry = MidiParser.parse_structure(filepath, 1.0, tracks=selection)
+        if digest is not None:
+            try: self.disk_cache.store(digest, *entry)
+            except OSError as e: print(f"Error writing song cache: {e}")
+        return entry
+
+    def stats(self) -> str:
+        return f"Song cache: {self.hits} memory hits, {self.disk_hits} disk hits, {self.misses} misses"
+
+    def clear(self):
+        self._entries.clear()
+        self._scans.clear()
@@ -1,20 +1,139 @@
 import mido
 import bisect
-from collections import defaultdict
-from typing import List, Tuple, Dict, Optional
-from models import Note, MidiTrack
+import heapq
+import numpy as np
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Optional, Sequence, Iterator
+from models import Note, NoteTable, MidiTrack, TrackInfo
+from smf import SmfFile, SmfFallback, TrackEvents, NotePairer, NotePairs, PAIR_FIFO, PAIR_LIFO
 from pynput.keyboard import Key
 
-def get_time_groups(notes: List[Note], threshold: float = 0.015) -> List[List[Note]]:
-    if not notes: return []
-    groups, current_group = [], [notes[0]]
-    for i in range(1, len(notes)):
-        if notes[i].start_time - current_group[0].start_time <= threshold: current_group.append(notes[i])
-        else:
-            groups.append(current_group)
-            current_group = [notes[i]]
-    groups.append(current_group)
-    return groups
+class TimeGroups:
+    # Chord groups over start-sorted notes: each takes every note within threshold of its first; breaks force a new group.
+    def __init__(self, offsets: np.ndarray):
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, starts, threshold: float = 0.015, breaks=None) -> 'TimeGroups':
+        starts = np.asarray(starts, dtype=np.float64)
+        n = len(starts)
+        if not n: return cls(np.zeros(1, dtype=np.int64))
+        index = np.arange(n)
+        window_end = np.searchsorted(starts, starts + threshold, side='right')
+        # searchsorted compares against start + threshold; settle the edge with the exact
+        # start - anchor test so grouping matches a sequential scan bit for bit.
+        while True:
+            grow = (window_end < n) & (starts[np.minimum(window_end, n - 1)] - starts <= threshold)
+            shrink = (window_end > index + 1) & (starts[window_end - 1] - starts > threshold)
+            if not (grow.any() or shrink.any()): break
+            window_end = window_end + grow - shrink
+        if breaks is not None and len(breaks):
+            breaks = np.append(np.unique(breaks), n)
+            window_end = np.minimum(window_end, breaks[np.searchsorted(breaks, index, side='right')])
+        next_group = window_end.tolist()
+        offsets, i = [], 0
+        while i < n:
+            offsets.append(i)
+            i = next_group[i]
+        offsets.append(n)
+        return cls(np.array(offsets, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def firsts(self) -> np.ndarray:
+        return self.offsets[:-1]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def group_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    def ranges(self):
+        return zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+
+class ConcurrencyIndex:
+    # Start-sorted notes answering windowed lowest-pitch and pitch-class queries in O(1).
+    def __init__(self, starts, pitches):
+        starts = np.asarray(starts, dtype=np.float64)
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.pitches = np.asarray(pitches, dtype=np.int64)[order]
+        n = len(self.pitches)
+        self._min_levels = [self.pitches]
+        width = 1
+        while 2 * width <= n:
+            prev = self._min_levels[-1]
+            self._min_levels.append(np.minimum(prev[:-width], prev[width:]))
+            width *= 2
+        classes = np.zeros((12, n + 1), dtype=np.int32)
+        np.cumsum(self.pitches[None, :] % 12 == np.arange(12)[:, None], axis=1, out=classes[:, 1:])
+        self._class_counts = classes
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def window(self, times, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        # [lo, hi) of the notes with abs(start - t) <= radius, evaluated exactly as written.
+        times = np.asarray(times, dtype=np.float64)
+        starts, n = self.starts, len(self.starts)
+        lo = np.searchsorted(starts, times - radius, side='left')
+        hi = np.searchsorted(starts, times + radius, side='right')
+        # abs(start - t) is monotone over sorted starts, so only the edges can disagree with the
+        # shifted searchsorted keys; nudge them until the exact test holds.
+        while True:
+            lo_grow = (lo > 0) & (np.abs(starts[np.maximum(lo - 1, 0)] - times) <= radius)
+            lo_shrink = (lo < n) & (lo < hi) & (np.abs(starts[np.minimum(lo, n - 1)] - times) > radius)
+            hi_grow = (hi < n) & (np.abs(starts[np.minimum(hi, n - 1)] - times) <= radius)
+            hi_shrink = (hi > lo) & (np.abs(starts[np.maximum(hi - 1, 0)] - times) > radius)
+            if not (lo_grow.any() or lo_shrink.any() or hi_grow.any() or hi_shrink.any()): break
+            lo = lo - lo_grow + lo_shrink
+            hi = hi + hi_grow - hi_shrink
+        return lo, np.maximum(hi, lo)
+
+    def min_pitch(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        # Lowest pitch in each range [lo, hi); 128 when empty.
+        size = hi - lo
+        nonempty = size > 0
+        level = np.zeros(len(lo), dtype=np.int64)
+        level[nonempty] = np.floor(np.log2(size[nonempty])).astype(np.int64)
+        result = np.full(len(lo), 128, dtype=np.int64)
+        for k in np.unique(level[nonempty]).tolist():
+            sel = np.flatnonzero(nonempty & (level == k))
+            table, width = self._min_levels[k], 1 << k
+            result[sel] = np.minimum(table[lo[sel]], table[hi[sel] - width])
+        return result
+
+    def has_pitch_class(self, lo: np.ndarray, hi: np.ndarray, pitch_classes: np.ndarray) -> np.ndarray:
+        # Whether any note in [lo[i], hi[i]) has pitch class pitch_classes[i].
+        return self._class_counts[pitch_classes, hi] > self._class_counts[pitch_classes, lo]
+
+@dataclass
+class MeasureGrid:
+    start_times: np.ndarray
+    end_times: np.ndarray
+    start_beats: np.ndarray
+    end_beats: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.start_times)
+
+    def truncated(self, count: int) -> 'MeasureGrid':
+        return MeasureGrid(self.start_times[:count], self.end_times[:count], self.start_beats[:count], self.end_beats[:count])
+
+    def measure_index_of(self, times) -> np.ndarray:
+        times = np.asarray(times, dtype=np.float64)
+        idx = np.searchsorted(self.start_times, times, side='right') - 1
+        if not len(self): return np.full(times.shape, -1, dtype=np.int64)
+        inside = (idx >= 0) & (times < self.end_times[np.maximum(idx, 0)])
+        return np.where(inside, idx, -1)
+
+    def boundaries(self) -> List[Tuple[float, float]]:
+        return list(zip(self.start_times.tolist(), self.end_times.tolist()))
 
 class TempoMap:
     def __init__(self, tempo_events: List[Tuple[float, int]], time_signatures: List[Tuple[float, int, int]]):
@@ -22,6 +141,9 @@ class TempoMap:
         self.time_signatures = sorted(time_signatures, key=lambda x: x[0])
         self.beat_map = [] 
         self._build_beat_map()
+        self._build_arrays()
+        self._measure_grid: Optional[MeasureGrid] = None
+        self._measure_grid_beats = -1.0
         self.has_explicit_time_signatures = len(time_signatures) > 0 and not (len(time_signatures) == 1 and time_signatures[0][0] == 0 and time_signatures[0][1] == 4)
 
     def _build_beat_map(self):
@@ -42,8 +164,18 @@ class TempoMap:
             last_time = time_sec
             current_tempo = new_tempo
 
+    def _build_arrays(self):
+        self._map_times = [e[0] for e in self.beat_map]
+        self._map_beats = [e[1] for e in self.beat_map]
+        self._event_times = [e[0] for e in self.events]
+        self.map_times = np.array(self._map_times, dtype=np.float64)
+        self.map_beats = np.array(self._map_beats, dtype=np.float64)
+        self.map_sec_per_beat = np.array([e[2] for e in self.beat_map], dtype=np.float64) / 1_000_000.0
+        self.event_times = np.array(self._event_times, dtype=np.float64)
+        self.event_tempos = np.array([e[1] for e in self.events], dtype=np.float64)
+
     def time_to_beat(self, t: float) -> float:
-        idx = bisect.bisect_right([e[0] for e in self.beat_map], t) - 1
+        idx = bisect.bisect_right(self._map_times, t) - 1
         if idx < 0: return 0.0
         
         start_time, start_beat, tempo = self.beat_map[idx]
@@ -52,7 +184,7 @@ class TempoMap:
         return start_beat + (dt / sec_per_beat)
         
     def beat_to_time(self, b: float) -> float:
-        idx = bisect.bisect_right([e[1] for e in self.beat_map], b) - 1
+        idx = bisect.bisect_right(self._map_beats, b) - 1
         if idx < 0: return 0.0
         
         start_time, start_beat, tempo = self.beat_map[idx]
@@ -61,35 +193,79 @@ class TempoMap:
         return start_time + (dt_beats * sec_per_beat)
 
     def get_tempo_at(self, time: float) -> int:
-        idx = bisect.bisect_right([e[0] for e in self.events], time) - 1
+        idx = bisect.bisect_right(self._event_times, time) - 1
         if idx < 0: return 500000
         return self.events[idx][1]
 
+    def times_to_beats(self, times) -> np.ndarray:
+        times = np.asarray(times, dtype=np.float64)
+        idx = np.searchsorted(self.map_times, times, side='right') - 1
+        safe = np.maximum(idx, 0)
+        beats = self.map_beats[safe] + (times - self.map_times[safe]) / self.map_sec_per_beat[safe]
+        return np.where(idx < 0, 0.0, beats)
+
+    def beats_to_times(self, beats) -> np.ndarray:
+        beats = np.asarray(beats, dtype=np.float64)
+        idx = np.searchsorted(self.map_beats, beats, side='right') - 1
+        safe = np.maximum(idx, 0)
+        times = self.map_times[safe] + (beats - self.map_beats[safe]) * self.map_sec_per_beat[safe]
+        return np.where(idx < 0, 0.0, times)
+
+    def tempos_at(self, times) -> np.ndarray:
+        times = np.asarray(times, dtype=np.float64)
+        if not len(self.events): return np.full(times.shape, 500000.0)
+        idx = np.searchsorted(self.event_times, times, side='right') - 1
+        return np.where(idx < 0, 500000.0, self.event_tempos[np.maximum(idx, 0)])
+
+    def scaled(self, tempo_scale: float) -> 'TempoMap':
+        events = [(t / tempo_scale, tempo / tempo_scale) for t, tempo in self.events]
+        time_signatures = [(t / tempo_scale, num, den) for t, num, den in self.time_signatures]
+        return TempoMap(events, time_signatures)
+
     def get_measure_boundaries(self, total_duration: float) -> List[Tuple[float, float]]:
-        measures = []
-        ts_events = self.time_signatures if self.time_signatures else [(0.0, 4, 4)]
+        return self.measure_grid(total_duration).boundaries()
+
+    def measure_grid(self, total_duration: float) -> MeasureGrid:
         total_beats = self.time_to_beat(total_duration)
+        if self._measure_grid is None or total_beats > self._measure_grid_beats:
+            self._measure_grid = self._build_measure_grid(total_beats)
+            self._measure_grid_beats = total_beats
+        grid = self._measure_grid
+        return grid.truncated(int(np.searchsorted(grid.start_beats, total_beats, side='left')))
+
+    def _build_measure_grid(self, total_beats: float) -> MeasureGrid:
+        # Measures are laid out one time-signature segment at a time: within a segment every
+        # measure has the same length, so its start beats are a single cumulative sum.
+        ts_events = self.time_signatures if self.time_signatures else [(0.0, 4, 4)]
+        segments = []
         measure_start_beat = 0.0
-        
+        active = 0
         while measure_start_beat < total_beats:
             measure_start_time = self.beat_to_time(measure_start_beat)
-            active_ts = ts_events[0]
-            for ts in ts_events:
-                if ts[0] <= measure_start_time + 0.001:
-                    active_ts = ts
-                else:
-                    break
+            while active + 1 < len(ts_events) and ts_events[active + 1][0] <= measure_start_time + 0.001:
+                active += 1
+            _, numerator, denominator = ts_events[active]
+            measure_len_beats = numerator * (4.0 / denominator)
             
-            current_numerator = active_ts[1]
-            beat_len_factor = 4.0 / active_ts[2]
-            measure_len_beats = current_numerator * beat_len_factor
-            
-            measure_end_beat = measure_start_beat + measure_len_beats
-            measure_end_time = self.beat_to_time(measure_end_beat)
-            
-            measures.append((measure_start_time, measure_end_time))
-            measure_start_beat = measure_end_beat
-        return measures
+            limit_beats = total_beats
+            if active + 1 < len(ts_events):
+                limit_beats = min(limit_beats, self.time_to_beat(ts_events[active + 1][0]))
+            count = max(int(np.ceil((limit_beats - measure_start_beat) / measure_len_beats)) + 1, 1)
+            start_beats = np.cumsum(np.concatenate(([measure_start_beat], np.full(count - 1, measure_len_beats))))
+            valid = start_beats < total_beats
+            if active + 1 < len(ts_events):
+                valid &= ts_events[active + 1][0] > self.beats_to_times(start_beats) + 0.001
+            valid[0] = True
+            count = len(valid) if valid.all() else int(np.argmin(valid))
+            segments.append((start_beats[:count], start_beats[:count] + measure_len_beats))
+            measure_start_beat = float(segments[-1][1][-1])
+        
+        if segments:
+            start_beats = np.concatenate([seg[0] for seg in segments])
+            end_beats = np.concatenate([seg[1] for seg in segments])
+        else:
+            start_beats = end_beats = np.empty(0, dtype=np.float64)
+        return MeasureGrid(self.beats_to_times(start_beats), self.beats_to_times(end_beats), start_beats, end_beats)
 
 class GlobalTickMap:
     def __init__(self, midi_file: mido.MidiFile):
@@ -115,35 +291,239 @@ class GlobalTickMap:
                 self.tick_map.append((current_tick, current_time, current_tempo))
             elif msg.type == 'time_signature':
                 self.time_signatures.append((current_time, msg.numerator, msg.denominator))
+        self._build_arrays()
+
+    @classmethod
+    def from_events(cls, ticks_per_beat: int, tempo_events: List[Tuple[int, int]], time_signatures: List[Tuple[int, int, int]]) -> 'GlobalTickMap':
+        # Events are (tick, ...) tuples already merged in playback order across tracks.
+        self = cls.__new__(cls)
+        self.ticks_per_beat = ticks_per_beat or 480
+        self.tick_map = [(0, 0.0, 500000)]
+        for tick, tempo in tempo_events:
+            last_tick, last_time, last_tempo = self.tick_map[-1]
+            self.tick_map.append((tick, last_time + mido.tick2second(tick - last_tick, self.ticks_per_beat, last_tempo), tempo))
+        self._build_arrays()
+        self.time_signatures = [(self.tick_to_time(tick), numerator, denominator) for tick, numerator, denominator in time_signatures]
+        return self
+
+    def _build_arrays(self):
+        self.map_ticks = np.array([e[0] for e in self.tick_map], dtype=np.int64)
+        self.map_seconds = np.array([e[1] for e in self.tick_map], dtype=np.float64)
+        self.map_sec_per_tick = np.array([e[2] for e in self.tick_map], dtype=np.float64) * 1e-6 / self.ticks_per_beat
+        self._tick_keys = self.map_ticks.tolist()
 
     def tick_to_time(self, tick: int) -> float:
-        last_tick, last_time, tempo = self.tick_map[0]
-        for t_tick, t_time, t_tempo in self.tick_map:
-            if tick >= t_tick: last_tick, last_time, tempo = t_tick, t_time, t_tempo
-            else: break
-        delta_ticks = tick - last_tick
-        return last_time + mido.tick2second(delta_ticks, self.ticks_per_beat, tempo)
+        idx = max(bisect.bisect_right(self._tick_keys, tick) - 1, 0)
+        last_tick, last_time, tempo = self.tick_map[idx]
+        return last_time + mido.tick2second(tick - last_tick, self.ticks_per_beat, tempo)
+
+    def ticks_to_times(self, ticks) -> np.ndarray:
+        ticks = np.asarray(ticks, dtype=np.int64)
+        idx = np.searchsorted(self.map_ticks, ticks, side='right') - 1
+        np.maximum(idx, 0, out=idx)
+        return self.map_seconds[idx] + (ticks - self.map_ticks[idx]) * self.map_sec_per_tick[idx]
+
+_STREAM_TEMPO, _STREAM_NOTE_ON, _STREAM_NOTE_OFF = 0, 1, 2
+
+@dataclass
+class _StreamProgress:
+    # Yielded so far: every note keyed (start tick, track) before `frontier`, the (channel, pitch) counts yielded at
+    # it, less the long notes still `pending` past it, keyed (start tick, track, channel, pitch).
+    frontier: Tuple[int, int] = (-1, -1)
+    at_frontier: Counter = field(default_factory=Counter)
+    pending: Counter = field(default_factory=Counter)
 
 class MidiParser:
     @staticmethod
-    def parse_structure(filepath: str, tempo_scale: float = 1.0, debug_log: Optional[List[str]] = None) -> Tuple[List[MidiTrack], TempoMap]:
+    def parse_structure(filepath: str, tempo_scale: float = 1.0, debug_log: Optional[List[str]] = None,
+                        pairing: str = PAIR_FIFO, workers: Optional[int] = None,
+                        tracks: Optional[Sequence[int]] = None) -> Tuple[List[MidiTrack], TempoMap]:
+        decoded, global_map = MidiParser._read_with_fallback(filepath, pairing, workers, tracks, debug_log)
+        paired = [pairs for _, pairs in decoded if pairs is not None]
+        orphan_ons = sum(pairs.orphan_note_ons for pairs in paired)
+        orphan_offs = sum(pairs.orphan_note_offs for pairs in paired)
+        if debug_log is not None and (orphan_ons or orphan_offs):
+            debug_log.append(f"Note pairing ({pairing}): {orphan_ons} note-ons never released, {orphan_offs} note-offs without a note-on")
+        return MidiParser._build_tracks(decoded, global_map, tempo_scale)
+
+    @staticmethod
+    def scan_metadata(filepath: str, debug_log: Optional[List[str]] = None) -> Tuple[List[TrackInfo], TempoMap]:
+        # Selecting no tracks makes every track a metadata scan, spread over worker processes for large files.
+        decoded, global_map = MidiParser._read_with_fallback(filepath, PAIR_FIFO, None, (), debug_log)
+        tracks = [TrackInfo(events.index, events.name, events.program_change, events.is_drum or events.has_drum_notes, events.note_on_count)
+                  for events, _ in decoded if events.note_on_count]
+        return tracks, MidiParser._tempo_map(global_map)
+
+    @staticmethod
+    def _read_with_fallback(filepath: str, pairing: str, workers: Optional[int], tracks: Optional[Sequence[int]],
+                            debug_log: Optional[List[str]], failure: Optional[Exception] = None) -> Tuple[List[Tuple[TrackEvents, Optional[NotePairs]]], GlobalTickMap]:
+        # Decodes with the fast reader unless a caller already saw it fail, then falls back to mido.
+        if failure is None:
+            try:
+                with SmfFile(filepath) as smf:
+                    decoded = smf.decode_and_pair(pairing, workers, tracks)
+                    return decoded, MidiParser._merge_tempo_events(smf.ticks_per_beat, [events for events, _ in decoded])
+            except (SmfFallback, OSError) as e:
+                failure = e
+        if isinstance(failure, OSError): raise IOError(f"Could not read MIDI file: {failure}")
+        if debug_log is not None: debug_log.append(f"Fast MIDI parser unavailable ({failure}), falling back to mido")
+        track_events, global_map = MidiParser._read_with_mido(filepath)
+        pairer = NotePairer(pairing)
+        return [(events, pairer.pair(events) if tracks is None or events.index in tracks else None) for events in track_events], global_map
+
+    @staticmethod
+    def _merge_tempo_events(ticks_per_beat: int, track_events: List[TrackEvents]) -> GlobalTickMap:
+        # Stable sort keeps track order for events on the same tick, as mido.merge_tracks does.
+        tempo_events = sorted((e for t in track_events for e in t.tempo_events), key=lambda e: e[0])
+        time_signatures = sorted((ts for t in track_events for ts in t.time_signatures), key=lambda ts: ts[0])
+        return GlobalTickMap.from_events(ticks_per_beat, tempo_events, time_signatures)
+
+    @staticmethod
+    def _tempo_map(global_map: GlobalTickMap) -> TempoMap:
+        return TempoMap([(entry[1], entry[2]) for entry in global_map.tick_map], global_map.time_signatures)
+
+    @staticmethod
+    def iter_notes(filepath: str, tempo_scale: float = 1.0, tracks: Optional[Sequence[int]] = None, pairing: str = PAIR_FIFO,
+                   max_note_length: float = 30.0, chunk_notes: int = 4096, debug_log: Optional[List[str]] = None) -> Iterator[Note]:
+        # parse_structure's notes in start order while decoding; notes held past max_note_length come late, when they end.
+        yielded = 0
+        progress = _StreamProgress()
+        try:
+            for note in MidiParser._stream_notes(filepath, tempo_scale, tracks, pairing, max_note_length, chunk_notes, progress):
+                yield note
+                yielded += 1
+            return
+        except (SmfFallback, OSError) as e:
+            failure = e
+        decoded, global_map = MidiParser._read_with_fallback(filepath, pairing, None, tracks, debug_log, failure)
+        decoded = [(events, None if pairs is None else MidiParser._unyielded(pairs, events.index, progress)) for events, pairs in decoded]
+        song_tracks, _ = MidiParser._build_tracks(decoded, global_map, tempo_scale)
+        table = NoteTable.concatenate([track.table for track in song_tracks])
+        table = table[table.start_order()]
+        table.id = np.arange(yielded, yielded + len(table))
+        yield from table.to_notes()
+
+    @staticmethod
+    def _unyielded(pairs: NotePairs, track: int, progress: _StreamProgress) -> NotePairs:
+        frontier_tick, frontier_track = progress.frontier
+        keep = (pairs.start_tick > frontier_tick) | ((pairs.start_tick == frontier_tick) & (track > frontier_track))
+        if track == frontier_track:
+            # Pairs come in close order, the order the stream yields notes sharing a start tick and track.
+            at_frontier = progress.at_frontier.copy()
+            for i in np.flatnonzero(pairs.start_tick == frontier_tick).tolist():
+                key = (int(pairs.channel[i]), int(pairs.pitch[i]))
+                if at_frontier[key] > 0: at_frontier[key] -= 1
+                else: keep[i] = True
+        for (start_tick, pending_track, channel, pitch), count in progress.pending.items():
+            if pending_track != track or count <= 0: continue
+            matches = np.flatnonzero(~keep & (pairs.start_tick == start_tick) & (pairs.channel == channel) & (pairs.pitch == pitch))
+            keep[matches[:count]] = True
+        return NotePairs(pairs.start_tick[keep], pairs.end_tick[keep], pairs.channel[keep], pairs.pitch[keep], pairs.velocity[keep])
+
+    @staticmethod
+    def _stream_notes(filepath: str, tempo_scale: float, tracks: Optional[Sequence[int]], pairing: str,
+                      max_note_length: float, chunk_notes: int, progress: _StreamProgress) -> Iterator[Note]:
+        lifo = pairing == PAIR_LIFO
+        with SmfFile(filepath) as smf:
+            ticks_per_beat = smf.ticks_per_beat or 480
+            selected = set(range(len(smf)) if tracks is None else tracks)
+            # Tempo segments (tick, seconds, seconds per tick), the same arithmetic as GlobalTickMap.from_events.
+            seg_ticks, seg_times, seg_tempos, seg_sec_per_tick = [0], [0.0], [500000], [500000 * 1e-6 / ticks_per_beat]
+            open_slots: Dict[Tuple[int, int, int], deque] = defaultdict(deque)
+            open_notes: Dict[int, list] = {}
+            open_heap: List[Tuple[int, int, int]] = []
+            done_heap: List[Tuple] = []
+            uid = closed = next_id = 0
+
+            def time_at(tick: int) -> float:
+                i = bisect.bisect_right(seg_ticks, tick) - 1
+                return seg_times[i] + (tick - seg_ticks[i]) * seg_sec_per_tick[i]
+
+            def drain(current_tick: int) -> Iterator[Note]:
+                nonlocal next_id
+                while open_heap and open_heap[0][2] not in open_notes: heapq.heappop(open_heap)
+                bound = open_heap[0][:2] if open_heap else None
+                while done_heap:
+                    start_tick, track, _, end_tick, channel, pitch, velocity, late = done_heap[0]
+                    if bound is not None and (start_tick, track) > bound: break
+                    # Tempo changes from later tracks on the end tick are not merged in yet.
+                    if end_tick >= current_tick: break
+                    heapq.heappop(done_heap)
+                    start = time_at(start_tick)
+                    duration = time_at(end_tick) - start
+                    if duration > 0.01:
+                        if late:
+                            progress.pending[start_tick, track, channel, pitch] -= 1
+                        else:
+                            if (start_tick, track) != progress.frontier: progress.frontier, progress.at_frontier = (start_tick, track), Counter()
+                            progress.at_frontier[channel, pitch] += 1
+                        yield Note(next_id, pitch, velocity, start / tempo_scale, duration / tempo_scale, 'unknown', track, channel)
+                        next_id += 1
+
+            streams = [MidiParser._track_event_stream(smf, i, chunk_notes) for i in range(len(smf))]
+            current_tick = 0
+            for tick, track, kind, channel, pitch, velocity in heapq.merge(*streams, key=lambda e: (e[0], e[1])):
+                if tick != current_tick:
+                    yield from drain(tick)
+                    current_tick = tick
+                    now = seg_times[-1] + (tick - seg_ticks[-1]) * seg_sec_per_tick[-1]
+                    while open_heap and (open_heap[0][2] not in open_notes or now - time_at(open_heap[0][0]) > max_note_length):
+                        entry = open_notes.get(heapq.heappop(open_heap)[2])
+                        if entry is None: continue
+                        # Held too long: it stops holding back the stream and is yielded late if it ever ends.
+                        entry[4] = True
+                        progress.pending[entry[0], entry[3], entry[5], entry[6]] += 1
+                if kind == _STREAM_TEMPO:
+                    seg_times.append(seg_times[-1] + mido.tick2second(tick - seg_ticks[-1], ticks_per_beat, seg_tempos[-1]))
+                    seg_ticks.append(tick)
+                    seg_tempos.append(velocity)
+                    seg_sec_per_tick.append(velocity * 1e-6 / ticks_per_beat)
+                    continue
+                if track not in selected: continue
+                slots = open_slots[(track, channel, pitch)]
+                if kind == _STREAM_NOTE_ON:
+                    # [start tick, velocity, uid, track, no longer holding the stream, channel, pitch]
+                    entry = [tick, velocity, uid, track, False, channel, pitch]
+                    slots.append(entry)
+                    open_notes[uid] = entry
+                    heapq.heappush(open_heap, (tick, track, uid))
+                    uid += 1
+                elif slots:
+                    entry = slots.pop() if lifo else slots.popleft()
+                    del open_notes[entry[2]]
+                    heapq.heappush(done_heap, (entry[0], track, closed, tick, channel, pitch, entry[1], entry[4]))
+                    closed += 1
+            # Notes never released are dropped, as parse_structure drops orphan note-ons.
+            open_notes.clear()
+            yield from drain(current_tick + 1)
+
+    @staticmethod
+    def _track_event_stream(smf: SmfFile, index: int, chunk_notes: int) -> Iterator[Tuple[int, int, int, int, int, int]]:
+        for chunk in smf.iter_track_chunks(index, chunk_notes):
+            tempos = chunk.tempo_events
+            t = 0
+            for tick, is_on, channel, pitch, velocity in zip(chunk.ticks.tolist(), chunk.is_on.tolist(), chunk.channel.tolist(),
+                                                             chunk.pitch.tolist(), chunk.velocity.tolist()):
+                while t < len(tempos) and tempos[t][0] <= tick:
+                    yield tempos[t][0], index, _STREAM_TEMPO, 0, 0, tempos[t][1]
+                    t += 1
+                yield tick, index, _STREAM_NOTE_ON if is_on else _STREAM_NOTE_OFF, channel, pitch, velocity
+            for tempo_tick, tempo in tempos[t:]:
+                yield tempo_tick, index, _STREAM_TEMPO, 0, 0, tempo
+
+    @staticmethod
+    def _read_with_mido(filepath: str) -> Tuple[List[TrackEvents], GlobalTickMap]:
         try:
             mid = mido.MidiFile(filepath)
         except Exception as e:
             raise IOError(f"Could not read MIDI file: {e}")
-            
-        global_map = GlobalTickMap(mid)
-        tempo_map_data = [(entry[1], entry[2]) for entry in global_map.tick_map]
-        tempo_map = TempoMap(tempo_map_data, global_map.time_signatures)
-        tracks = []
-        note_id_counter = 0
-        
+
+        track_events = []
         for i, track in enumerate(mid.tracks):
             track_name = f"Track {i}"
             program_change = 0
             is_drum = False
-            notes: List[Note] = []
-            open_notes: Dict[int, List[Dict]] = defaultdict(list)
+            columns: Dict[str, List] = defaultdict(list)
             current_abs_tick = 0
             
             for msg in track:
@@ -152,25 +532,45 @@ class MidiParser:
                 if msg.type == 'program_change':
                     program_change = msg.program
                     if msg.channel == 9: is_drum = True
-                
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    open_notes[msg.note].append({'start_tick': current_abs_tick, 'vel': msg.velocity})
-                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    if open_notes[msg.note]:
-                        note_data = open_notes[msg.note].pop(0)
-                        start_sec = global_map.tick_to_time(note_data['start_tick'])
-                        end_sec = global_map.tick_to_time(current_abs_tick)
-                        duration = end_sec - start_sec
-                        if duration > 0.01:
-                            scaled_start = start_sec / tempo_scale
-                            scaled_duration = duration / tempo_scale
-                            notes.append(Note(note_id_counter, msg.note, note_data['vel'], scaled_start, scaled_duration, 'unknown', i, msg.channel))
-                            note_id_counter += 1
-            if any(n.channel == 9 for n in notes): is_drum = True
-            if notes:
-                notes.sort(key=lambda n: n.start_time)
-                tracks.append(MidiTrack(i, track_name, program_change, is_drum, notes))
-        return tracks, tempo_map
+                if msg.type == 'note_on' or msg.type == 'note_off':
+                    columns['tick'].append(current_abs_tick)
+                    columns['is_on'].append(msg.type == 'note_on' and msg.velocity > 0)
+                    columns['channel'].append(msg.channel)
+                    columns['pitch'].append(msg.note)
+                    columns['velocity'].append(msg.velocity)
+            track_events.append(TrackEvents.from_columns(i, track_name, program_change, is_drum, columns['tick'], columns['is_on'],
+                                                         columns['channel'], columns['pitch'], columns['velocity']))
+        return track_events, GlobalTickMap(mid)
+
+    @staticmethod
+    def _build_tracks(decoded: List[Tuple[TrackEvents, Optional[NotePairs]]], global_map: GlobalTickMap, tempo_scale: float) -> Tuple[List[MidiTrack], TempoMap]:
+        tracks = []
+        note_id_counter = 0
+
+        for events, pairs in decoded:
+            if pairs is None: continue
+            start_sec = global_map.ticks_to_times(pairs.start_tick)
+            duration = global_map.ticks_to_times(pairs.end_tick) - start_sec
+            keep = duration > 0.01
+            count = int(np.count_nonzero(keep))
+            if not count: continue
+            channels = pairs.channel[keep]
+            is_drum = events.is_drum or bool(np.any(channels == 9))
+            table = NoteTable.from_columns(
+                id=np.arange(note_id_counter, note_id_counter + count),
+                pitch=pairs.pitch[keep],
+                velocity=pairs.velocity[keep],
+                start=start_sec[keep] / tempo_scale,
+                duration=duration[keep] / tempo_scale,
+                track=events.index,
+                channel=channels,
+            ).sorted_by_start()
+            note_id_counter += count
+            tracks.append(MidiTrack(events.index, events.name, events.program_change, is_drum, table))
+        return tracks, MidiParser._tempo_map(global_map)
+
+MOD_NONE, MOD_SHIFT, MOD_CTRL = 0, 1, 2
+MODIFIER_KEYS = ((), (Key.shift,), (Key.ctrl,))
 
 class KeyMapper:
     SYMBOL_MAP = {'!': '1', '@': '2', '#': '3', '$': '4', '%': '5', '^': '6', '&': '7', '*': '8', '(': '9', ')': '0'}
@@ -189,6 +589,7 @@ class KeyMapper:
         else:
             self.min_pitch = 36; self.max_pitch = 96  
         self.init_key_map()
+        self._build_pitch_table()
 
     def init_key_map(self):
         if self.use_88_key_layout:
@@ -216,16 +617,47 @@ class KeyMapper:
                 current_pitch += 1
             white_key_index += 1
 
+    def _build_pitch_table(self):
+        # Everything a note needs at dispatch time, resolved once per MIDI pitch:
+        # pitch_table[p] is (key_char, modifier_keys) after octave folding, or None.
+        self.key_chars = tuple(sorted({data['key'] for data in self.key_map.values()}))
+        key_codes = {char: code for code, char in enumerate(self.key_chars)}
+        table, pitch_key_codes, pitch_mod_codes = [], [], []
+        for pitch in range(128):
+            data = self.key_map.get(self.fold_pitch(pitch))
+            if data is None:
+                table.append(None); pitch_key_codes.append(-1); pitch_mod_codes.append(MOD_NONE)
+                continue
+            mod_code = MOD_CTRL if Key.ctrl in data['modifiers'] else MOD_SHIFT if Key.shift in data['modifiers'] else MOD_NONE
+            table.append((data['key'], MODIFIER_KEYS[mod_code]))
+            pitch_key_codes.append(key_codes[data['key']])
+            pitch_mod_codes.append(mod_code)
+        self.pitch_table = tuple(table)
+        self.pitch_key_codes = np.array(pitch_key_codes, dtype=np.int16)
+        self.pitch_mod_codes = np.array(pitch_mod_codes, dtype=np.int8)
+
+    def fold_pitch(self, pitch: int) -> int:
+        if pitch < self.min_pitch: return pitch + 12 * ((self.min_pitch - pitch + 11) // 12)
+        if pitch > self.max_pitch: return pitch - 12 * ((pitch - self.max_pitch + 11) // 12)
+        return pitch
+
+    def lookup(self, pitch: int) -> Optional[Tuple[str, Tuple[Key, ...]]]:
+        if 0 <= pitch < 128: return self.pitch_table[pitch]
+        data = self.key_map.get(self.fold_pitch(pitch))
+        return (data['key'], tuple(data['modifiers'])) if data else None
+
+    def map_pitches(self, pitches) -> Tuple[np.ndarray, np.ndarray]:
+        pitches = np.asarray(pitches, dtype=np.int64)
+        folded = np.where(pitches < self.min_pitch, pitches + 12 * ((self.min_pitch - pitches + 11) // 12), pitches)
+        folded = np.where(folded > self.max_pitch, folded - 12 * ((folded - self.max_pitch + 11) // 12), folded)
+        return self.pitch_key_codes[folded], self.pitch_mod_codes[folded]
+
     def get_key_data(self, pitch: int) -> Optional[Dict]:
-        if pitch < self.min_pitch:
-            while pitch < self.min_pitch: pitch += 12
-        elif pitch > self.max_pitch:
-            while pitch > self.max_pitch: pitch -= 12
-        return self.key_map.get(pitch)
+        return self.key_map.get(self.fold_pitch(pitch))
 
     def get_key_for_pitch(self, pitch: int) -> Optional[str]:
-        data = self.get_key_data(pitch)
-        return data['key'] if data else None
+        entry = self.lookup(pitch)
+        return entry[0] if entry else None
 
     @staticmethod
     def is_black_key(pitch: int) -> bool:
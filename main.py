@@ -2,24 +2,26 @@
 import sys
 import os
 import json
-import copy
+import multiprocessing
+import numpy as np
 from pathlib import Path
 from pynput import keyboard
 from pynput.keyboard import Key
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QCheckBox, QSlider, QLabel, QFileDialog,
-                             QGroupBox, QTabWidget, QTextEdit, QComboBox, QDoubleSpinBox, 
+                             QGroupBox, QTabWidget, QTextEdit, QComboBox, QDoubleSpinBox, QSpinBox, 
                              QMessageBox, QGridLayout, QStatusBar, QDialog, QTableWidget, 
                              QTableWidgetItem, QHeaderView, QAbstractItemView, QDialogButtonBox, 
                              QSizePolicy, QScrollArea)
 from PyQt6.QtCore import QObject, QThread, pyqtSignal as Signal, Qt
 from PyQt6.QtGui import QFont, QIcon
 
-from models import Note, MidiTrack
-from core import MidiParser
-from analysis import SectionAnalyzer, FingeringEngine
+from models import NoteTable, MidiTrack
+from cache import SongCache, DiskCache
+from analysis import FingeringEngine
 from visualizer import PianoWidget, TimelineWidget
 from player import Player
+from pipeline import PlaybackPipeline
 
 class HotkeyManager(QObject):
     toggle_requested = Signal()
@@ -120,7 +122,9 @@ class MainWindow(QMainWindow):
         self.config_dir.mkdir(exist_ok=True)
         self.selected_tracks_info = None 
         self.parsed_tempo_map = None
-        self.current_notes = [] 
+        self.song_cache = SongCache(DiskCache(self.config_dir / "cache"))
+        self.pipeline = PlaybackPipeline(self.song_cache)
+        self.current_notes = NoteTable()
         self.total_song_duration_sec = 1.0
 
         if getattr(sys, 'frozen', False):
@@ -328,10 +332,9 @@ class MainWindow(QMainWindow):
         if self.player: self.player.seek(time)
     
     def _on_visual_scrub(self, time):
-        active_pitches = set()
-        for note in self.current_notes:
-            if note.start_time <= time < note.end_time: active_pitches.add(note.pitch)
-        self.piano_widget.set_active_pitches(list(active_pitches))
+        notes = self.current_notes
+        active = (notes.start <= time) & (time < notes.end)
+        self.piano_widget.set_active_pitches(np.unique(notes.pitch[active]).tolist())
         self._update_time_label(time, self.total_song_duration_sec)
 
     def update_progress(self, current_time):
@@ -434,6 +437,29 @@ class MainWindow(QMainWindow):
         simple_toggles_layout.addStretch(1)
         simple_toggles_layout.addWidget(self.all_humanization_checks['enable_chord_roll'])
         main_v_layout.addLayout(simple_toggles_layout)
+
+        hand_search_layout = QHBoxLayout()
+        self.hand_beam_spinbox = QSpinBox()
+        self.hand_beam_spinbox.setRange(0, 64)
+        hand_search_layout.addWidget(QLabel("Hand Search Width"))
+        hand_search_layout.addWidget(self._create_info_icon("How many candidate hand assignments Simulate Hands keeps per chord.\n"
+                                                            "0 splits chords around middle C (fastest). Higher values pick better\n"
+                                                            "hand splits but take longer on large files."))
+        hand_search_layout.addStretch(1)
+        hand_search_layout.addWidget(self.hand_beam_spinbox)
+        self.all_humanization_checks['simulate_hands'].toggled.connect(self.hand_beam_spinbox.setEnabled)
+        main_v_layout.addLayout(hand_search_layout)
+
+        seed_layout = QHBoxLayout()
+        self.humanize_seed_spinbox = QSpinBox()
+        self.humanize_seed_spinbox.setRange(0, 2**31 - 1)
+        self.humanize_seed_spinbox.setSpecialValueText("Random")
+        seed_layout.addWidget(QLabel("Humanization Seed"))
+        seed_layout.addWidget(self._create_info_icon("Seed for timing, articulation and mistake variations.\n"
+                                                     "Any non-zero seed replays the same performance every time; 'Random' varies it on every Play."))
+        seed_layout.addStretch(1)
+        seed_layout.addWidget(self.humanize_seed_spinbox)
+        main_v_layout.addLayout(seed_layout)
         
         detailed_layout = QGridLayout()
         detailed_layout.setColumnStretch(2, 1) 
@@ -482,6 +508,8 @@ class MainWindow(QMainWindow):
         self.debug_check.setChecked(False)
 
     def _reset_humanization_group_to_default(self):
+        self.hand_beam_spinbox.setValue(FingeringEngine.DEFAULT_BEAM_WIDTH)
+        self.humanize_seed_spinbox.setValue(0)
         self.all_humanization_spinboxes['vary_timing'].setValue(0.010)
         self.all_humanization_spinboxes['vary_articulation'].setValue(95.0)
         self.all_humanization_spinboxes['hand_drift'].setValue(25.0)
@@ -518,6 +546,8 @@ class MainWindow(QMainWindow):
             'debug_mode': self.debug_check.isChecked(),
             'select_all_humanization': self.select_all_humanization_check.isChecked(),
             'simulate_hands': self.all_humanization_checks['simulate_hands'].isChecked(),
+            'hand_beam_width': self.hand_beam_spinbox.value(),
+            'humanize_seed': self.humanize_seed_spinbox.value(),
             'enable_chord_roll': self.all_humanization_checks['enable_chord_roll'].isChecked(),
             'vary_timing': self.all_humanization_checks['vary_timing'].isChecked(), 
             'value_timing_variance': self.all_humanization_spinboxes['vary_timing'].value(),
@@ -544,6 +574,7 @@ class MainWindow(QMainWindow):
             if key in self.all_humanization_sliders: self.all_humanization_sliders[key].setEnabled(is_checked)
             if key in self.all_humanization_spinboxes: self.all_humanization_spinboxes[key].setEnabled(is_checked)
         self.invert_sway_check.setEnabled(self.all_humanization_checks['tempo_sway'].isChecked())
+        self.hand_beam_spinbox.setEnabled(self.all_humanization_checks['simulate_hands'].isChecked())
 
     def _load_config(self):
         if not self.config_path.exists(): self._update_enabled_states(); return
@@ -558,6 +589,8 @@ class MainWindow(QMainWindow):
             self.debug_check.setChecked(config.get('debug_mode', False))
             self.select_all_humanization_check.setChecked(config.get('select_all_humanization', False))
             self.all_humanization_checks['simulate_hands'].setChecked(config.get('simulate_hands', False))
+            self.hand_beam_spinbox.setValue(config.get('hand_beam_width', FingeringEngine.DEFAULT_BEAM_WIDTH))
+            self.humanize_seed_spinbox.setValue(config.get('humanize_seed', 0))
             self.all_humanization_checks['enable_chord_roll'].setChecked(config.get('enable_chord_roll', False))
             self.all_humanization_checks['vary_timing'].setChecked(config.get('enable_vary_timing', False))
             self.all_humanization_spinboxes['vary_timing'].setValue(config.get('value_timing_variance', 0.010))
@@ -588,6 +621,8 @@ class MainWindow(QMainWindow):
             'pedal_style': internal_style, 
             'debug_mode': self.debug_check.isChecked(),
             'simulate_hands': self.all_humanization_checks['simulate_hands'].isChecked(),
+            'hand_beam_width': self.hand_beam_spinbox.value(),
+            'humanize_seed': self.humanize_seed_spinbox.value() or None,
             'vary_velocity': False,
             'enable_chord_roll': self.all_humanization_checks['enable_chord_roll'].isChecked(),
             'vary_timing': self.all_humanization_checks['vary_timing'].isChecked(), 
@@ -615,7 +650,7 @@ class MainWindow(QMainWindow):
     def _parse_and_select_tracks(self, filepath):
         self.add_log_message("Parsing MIDI structure...")
         try:
-            tracks, tempo_map = MidiParser.parse_structure(filepath, 1.0, None)
+            tracks, tempo_map = self.song_cache.scan(filepath)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to parse MIDI:\n{e}")
             return
@@ -638,47 +673,36 @@ class MainWindow(QMainWindow):
         if not config: return
         self._save_config()
         self.add_log_message("Preparing playback...")
-        tempo_scale = config['tempo'] / 100.0
+        # Stage inputs that are not GUI settings: the chosen tracks and the file's current version.
+        config['track_roles'] = tuple((t.index, r) for t, r in self.selected_tracks_info)
+        # 'Random' draws a new seed per Play, so the memoized humanization stages are redrawn too.
+        if config['humanize_seed'] is None: config['humanize_seed'] = int(np.random.SeedSequence().entropy)
+        if config.get('debug_mode'): self.add_log_message(f"Humanization seed: {config['humanize_seed']}")
         try:
-             tracks, tempo_map = MidiParser.parse_structure(config['midi_file'], tempo_scale, None)
-             selected_indices = [t.index for t, _ in self.selected_tracks_info]
-             role_map = {t.index: r for t, r in self.selected_tracks_info}
-             final_notes = []
-             if config.get('debug_mode'): self.add_log_message("\n=== RAW MIDI DATA (Selected Tracks) ===")
-             for track in tracks:
-                 if track.index in selected_indices:
-                     role = role_map[track.index]
-                     if config.get('debug_mode'): self.add_log_message(f"Track {track.index} ({track.name}): {len(track.notes)} Notes | Role: {role}")
-                     for note in track.notes:
-                         new_note = copy.deepcopy(note)
-                         if role == "Left Hand": new_note.hand = 'left'
-                         elif role == "Right Hand": new_note.hand = 'right'
-                         final_notes.append(new_note)
+             stat = os.stat(config['midi_file'])
+             config['midi_stamp'] = (stat.st_mtime_ns, stat.st_size)
+             selected_tracks, tempo_map = self.pipeline.run('song', config)
+             if config.get('debug_mode'): self.add_log_message(self.song_cache.stats())
+             if config.get('debug_mode'):
+                 role_map = dict(config['track_roles'])
+                 self.add_log_message("\n=== RAW MIDI DATA (Selected Tracks) ===")
+                 for track in selected_tracks:
+                     self.add_log_message(f"Track {track.index} ({track.name}): {track.note_count} Notes | Role: {role_map[track.index]}")
+             if config['simulate_hands']: self.add_log_message("Simulating hands for unassigned notes...")
+             final_notes = self.pipeline.run('notes', config)
         except Exception as e:
              QMessageBox.critical(self, "Error", f"Error preparing playback:\n{e}")
              return
-
-        final_notes.sort(key=lambda n: n.start_time)
-        self.current_notes = final_notes 
-        
-        if config['simulate_hands']:
-            self.add_log_message("Simulating hands for unassigned notes...")
-            engine = FingeringEngine()
-            engine.assign_hands(final_notes)
-        else:
-             for note in final_notes:
-                 if note.hand == 'unknown':
-                     note.hand = 'left' if note.pitch < 60 else 'right'
+        self.current_notes = final_notes
 
         self.add_log_message("Analyzing musical structure...")
-        analyzer = SectionAnalyzer(final_notes, tempo_map)
-        sections = analyzer.analyze()
+        sections = self.pipeline.run('sections', config)
         if config.get('debug_mode'):
             self.add_log_message("\n=== MUSICAL STRUCTURE ANALYSIS ===")
             for i, sec in enumerate(sections):
                 self.add_log_message(f"SECTION {i} [{sec.start_time:.2f}s - {sec.end_time:.2f}s] {sec.articulation_label}")
                 
-        total_dur = max(n.end_time for n in final_notes) if final_notes else 1.0
+        total_dur = float(final_notes.end.max()) if len(final_notes) else 1.0
         self.timeline_widget.set_data(final_notes, total_dur, tempo_map)
         self.total_song_duration_sec = total_dur
 
@@ -691,7 +715,7 @@ class MainWindow(QMainWindow):
         self.tabs.setCurrentIndex(1)
         
         self.player_thread = QThread()
-        self.player = Player(config, final_notes, sections, tempo_map)
+        self.player = Player(config, final_notes, sections, tempo_map, self.pipeline)
         self.player.moveToThread(self.player_thread)
         self.player_thread.started.connect(self.player.play)
         self.player.playback_finished.connect(self.on_playback_finished)
@@ -722,6 +746,7 @@ class MainWindow(QMainWindow):
         event.accept()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -1,5 +1,6 @@
+import numpy as np
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 @dataclass
 class Note:
@@ -16,29 +17,198 @@ class Note:
     def end_time(self) -> float:
         return self.start_time + self.duration
 
+HAND_UNKNOWN, HAND_LEFT, HAND_RIGHT = 0, 1, 2
+HAND_NAMES = ('unknown', 'left', 'right')
+HAND_CODES = {name: code for code, name in enumerate(HAND_NAMES)}
+
+NOTE_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('pitch', np.int16),
+    ('velocity', np.int16),
+    ('start', np.float64),
+    ('duration', np.float64),
+    ('hand', np.int8),
+    ('track', np.int32),
+    ('channel', np.int8),
+])
+
+def _column(name: str) -> property:
+    def getter(self) -> np.ndarray: return self.data[name]
+    def setter(self, value): self.data[name] = value
+    return property(getter, setter)
+
+class NoteTable:
+    # One structured record per note; column properties are writable views.
+    __slots__ = ('data',)
+
+    id = _column('id')
+    pitch = _column('pitch')
+    velocity = _column('velocity')
+    start = _column('start')
+    duration = _column('duration')
+    hand = _column('hand')
+    track = _column('track')
+    channel = _column('channel')
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        self.data = data if data is not None else np.empty(0, dtype=NOTE_DTYPE)
+
+    @classmethod
+    def empty(cls, size: int) -> 'NoteTable':
+        return cls(np.zeros(size, dtype=NOTE_DTYPE))
+
+    @classmethod
+    def from_columns(cls, id, pitch, velocity, start, duration, hand=HAND_UNKNOWN, track=-1, channel=-1) -> 'NoteTable':
+        table = cls.empty(len(start))
+        table.id, table.pitch, table.velocity = id, pitch, velocity
+        table.start, table.duration = start, duration
+        table.hand, table.track, table.channel = hand, track, channel
+        return table
+
+    @classmethod
+    def from_notes(cls, notes: Sequence[Note]) -> 'NoteTable':
+        rows = [(n.id, n.pitch, n.velocity, n.start_time, n.duration, HAND_CODES[n.hand], n.original_track_index, n.channel) for n in notes]
+        return cls(np.array(rows, dtype=NOTE_DTYPE))
+
+    @classmethod
+    def concatenate(cls, tables: Sequence['NoteTable']) -> 'NoteTable':
+        if not tables: return cls()
+        return cls(np.concatenate([t.data for t in tables]))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key) -> 'NoteTable':
+        return NoteTable(self.data[key])
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.data['start'] + self.data['duration']
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def copy(self) -> 'NoteTable':
+        return NoteTable(self.data.copy())
+
+    def scaled(self, tempo_scale: float) -> 'NoteTable':
+        table = self.copy()
+        table.start /= tempo_scale
+        table.duration /= tempo_scale
+        return table
+
+    def freeze(self) -> 'NoteTable':
+        self.data.flags.writeable = False
+        return self
+
+    def start_order(self) -> np.ndarray:
+        return np.argsort(self.data['start'], kind='stable')
+
+    def is_sorted_by_start(self) -> bool:
+        starts = self.data['start']
+        return bool(np.all(starts[1:] >= starts[:-1]))
+
+    def sorted_by_start(self) -> 'NoteTable':
+        return NoteTable(self.data[self.start_order()])
+
+    def of_hand(self, hand: int) -> 'NoteTable':
+        return NoteTable(self.data[self.data['hand'] == hand])
+
+    def note(self, i: int) -> Note:
+        r = self.data[i]
+        return Note(int(r['id']), int(r['pitch']), int(r['velocity']), float(r['start']), float(r['duration']), HAND_NAMES[r['hand']], int(r['track']), int(r['channel']))
+
+    def to_notes(self) -> List[Note]:
+        return [Note(i, p, v, s, d, HAND_NAMES[h], t, c) for i, p, v, s, d, h, t, c in self.data.tolist()]
+
+def _base_column(name: str) -> property:
+    return property(lambda self: self.base.data[name][self.index])
+
+class NoteOverlay:
+    # Humanized start/duration columns over selected rows of a shared base NoteTable.
+    __slots__ = ('base', 'index', 'start', 'duration')
+
+    id = _base_column('id')
+    pitch = _base_column('pitch')
+    velocity = _base_column('velocity')
+    hand = _base_column('hand')
+    track = _base_column('track')
+    channel = _base_column('channel')
+
+    def __init__(self, base: NoteTable, index: Optional[np.ndarray] = None, start: Optional[np.ndarray] = None, duration: Optional[np.ndarray] = None):
+        self.base = base
+        self.index = np.arange(len(base)) if index is None else index
+        self.start = base.start[self.index] if start is None else start
+        self.duration = base.duration[self.index] if duration is None else duration
+
+    @classmethod
+    def concatenate(cls, overlays: Sequence['NoteOverlay']) -> 'NoteOverlay':
+        return cls(overlays[0].base, np.concatenate([o.index for o in overlays]),
+                   np.concatenate([o.start for o in overlays]), np.concatenate([o.duration for o in overlays]))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, key) -> 'NoteOverlay':
+        return NoteOverlay(self.base, self.index[key], self.start[key], self.duration[key])
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.start + self.duration
+
+    def start_order(self) -> np.ndarray:
+        return np.argsort(self.start, kind='stable')
+
+    def sorted_by_start(self) -> 'NoteOverlay':
+        return self[self.start_order()]
+
+    def of_hand(self, hand: int) -> 'NoteOverlay':
+        return self[self.hand == hand]
+
+def instrument_name(program_change: int, is_drum: bool) -> str:
+    if is_drum: return "Drums/Percussion"
+    if 0 <= program_change <= 7: return "Piano"
+    if 8 <= program_change <= 15: return "Chromatic Perc"
+    if 16 <= program_change <= 23: return "Organ"
+    if 24 <= program_change <= 31: return "Guitar"
+    if 32 <= program_change <= 39: return "Bass"
+    if 40 <= program_change <= 47: return "Strings"
+    if 48 <= program_change <= 55: return "Ensemble"
+    return f"Instrument {program_change}"
+
 @dataclass
 class MidiTrack:
     index: int
     name: str
     program_change: int
     is_drum: bool
-    notes: List[Note]
+    table: NoteTable
+
+    @property
+    def notes(self) -> List[Note]:
+        return self.table.to_notes()
     
     @property
     def note_count(self) -> int:
-        return len(self.notes)
+        return len(self.table)
     
     @property
     def instrument_name(self) -> str:
-        if self.is_drum: return "Drums/Percussion"
-        if 0 <= self.program_change <= 7: return "Piano"
-        if 8 <= self.program_change <= 15: return "Chromatic Perc"
-        if 16 <= self.program_change <= 23: return "Organ"
-        if 24 <= self.program_change <= 31: return "Guitar"
-        if 32 <= self.program_change <= 39: return "Bass"
-        if 40 <= self.program_change <= 47: return "Strings"
-        if 48 <= self.program_change <= 55: return "Ensemble"
-        return f"Instrument {self.program_change}"
+        return instrument_name(self.program_change, self.is_drum)
+
+@dataclass
+class TrackInfo:
+    # note_count counts note-ons, before pairing.
+    index: int
+    name: str
+    program_change: int
+    is_drum: bool
+    note_count: int
+
+    @property
+    def instrument_name(self) -> str:
+        return instrument_name(self.program_change, self.is_drum)
 
 @dataclass(order=True)
 class KeyEvent:
@@ -48,11 +218,29 @@ class KeyEvent:
     key_char: str = field(compare=False)
     pitch: Optional[int] = field(default=None, compare=False)
 
+ACTION_PRESS, ACTION_RELEASE, ACTION_PEDAL = 0, 1, 2
+PEDAL_UP, PEDAL_DOWN = 0, 1
+
+EVENT_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('priority', np.int8),
+    ('action', np.int8),
+    ('key', np.int16),
+    ('pitch', np.int16),
+    ('modifier', np.int8),
+])
+
+def build_events(time, priority, action, key, pitch=-1, modifier=0) -> np.ndarray:
+    events = np.zeros(len(time), dtype=EVENT_DTYPE)
+    events['time'], events['priority'], events['action'] = time, priority, action
+    events['key'], events['pitch'], events['modifier'] = key, pitch, modifier
+    return events
+
 @dataclass
 class MusicalSection:
     start_time: float
     end_time: float
-    notes: List[Note]
+    notes: NoteTable
     articulation_label: str = 'unknown'
     pace_label: str = 'normal'
     start_beat: float = 0.0
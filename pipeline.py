@@ -0,0 +1,204 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Tuple
+from models import NoteTable, NoteOverlay, MusicalSection, HAND_UNKNOWN, HAND_LEFT, HAND_RIGHT, build_events, ACTION_PRESS, ACTION_RELEASE, ACTION_PEDAL, PEDAL_UP, PEDAL_DOWN
+from core import TempoMap, KeyMapper
+from cache import SongCache
+from analysis import Humanizer, PedalGenerator, SectionAnalyzer, FingeringEngine, round_hundredths
+
+@dataclass(frozen=True)
+class Stage:
+    # compute(config_subset, *input_outputs) over the named upstream stages.
+    name: str
+    compute: Callable[..., Any]
+    inputs: Tuple[str, ...] = ()
+    config_keys: Tuple[str, ...] = ()
+
+class StagePipeline:
+    # Reruns a stage only when its config subset or an input changed; outputs are shared and must not be mutated.
+    def __init__(self, stages: Sequence[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing: raise ValueError(f"Stage '{stage.name}' depends on undefined stages {missing}")
+            self.stages[stage.name] = stage
+        self._memo: Dict[str, Tuple[Hashable, Any]] = {}
+        self.recomputed: List[str] = []
+
+    def run(self, name: str, config: Dict) -> Any:
+        self.recomputed = []
+        return self._resolve(name, config, {})[1]
+
+    def _resolve(self, name: str, config: Dict, resolved: Dict[str, Tuple[Hashable, Any]]) -> Tuple[Hashable, Any]:
+        if name in resolved: return resolved[name]
+        stage = self.stages[name]
+        upstream = [self._resolve(dep, config, resolved) for dep in stage.inputs]
+        subset = {key: config.get(key) for key in stage.config_keys}
+        fingerprint = (tuple(subset.items()), tuple(key for key, _ in upstream))
+        memo = self._memo.get(name)
+        if memo is None or memo[0] != fingerprint:
+            memo = (fingerprint, stage.compute(subset, *(value for _, value in upstream)))
+            self._memo[name] = memo
+            self.recomputed.append(name)
+        resolved[name] = memo
+        return memo
+
+    def clear(self):
+        self._memo.clear()
+
+def section_index(sections: Sequence[MusicalSection], times: np.ndarray) -> np.ndarray:
+    # First section with start_time <= t < end_time for each time, or -1.
+    times = np.asarray(times, dtype=np.float64)
+    if not len(sections): return np.full(len(times), -1, dtype=np.int64)
+    starts = np.array([section.start_time for section in sections], dtype=np.float64)
+    running_end = np.maximum.accumulate(np.array([section.end_time for section in sections], dtype=np.float64))
+    started = np.searchsorted(starts, times, side='right')
+    first_open = np.searchsorted(running_end, times, side='right')
+    return np.where(first_open < started, first_open, -1)
+
+def _mistake_neighbor_table() -> Tuple[np.ndarray, np.ndarray]:
+    # Wrong-note candidates per pitch: +-1, +-2 from a black key, only white neighbours from a white key.
+    neighbors = np.zeros((128, 4), dtype=np.int64)
+    counts = np.zeros(128, dtype=np.int64)
+    for pitch in range(128):
+        candidates = [pitch - 2, pitch - 1, pitch + 1, pitch + 2]
+        if not KeyMapper.is_black_key(pitch): candidates = [p for p in candidates if not KeyMapper.is_black_key(p)]
+        neighbors[pitch, :len(candidates)] = candidates
+        counts[pitch] = len(candidates)
+    return neighbors, counts
+
+MISTAKE_NEIGHBORS, MISTAKE_NEIGHBOR_COUNTS = _mistake_neighbor_table()
+
+def _draw_mistakes(pitches: np.ndarray, section_ids: np.ndarray, chance: float, rng: np.random.Generator, mapper: KeyMapper) -> np.ndarray:
+    # A pitch's first note in each same-section run goes wrong with probability chance, onto a neighbour with a key.
+    if not len(pitches) or chance <= 0: return pitches
+    run = np.concatenate([[0], np.cumsum(section_ids[1:] != section_ids[:-1])])
+    eligible = np.zeros(len(pitches), dtype=bool)
+    eligible[np.unique(run * 128 + pitches, return_index=True)[1]] = True
+    candidates = np.flatnonzero(eligible)
+    # One uniform per eligible note: below `chance` it makes a mistake, and u / chance picks the neighbour.
+    draws = rng.random(len(candidates))
+    wrong = draws < chance
+    candidates, draws = candidates[wrong], draws[wrong]
+    original = pitches[candidates]
+    counts = MISTAKE_NEIGHBOR_COUNTS[original]
+    choice = np.minimum((draws / chance * counts).astype(np.int64), counts - 1)
+    mistake_pitches = MISTAKE_NEIGHBORS[original, choice]
+    keep = (mistake_pitches != 0) & (mapper.map_pitches(mistake_pitches)[0] >= 0)
+    played = pitches.copy()
+    played[candidates[keep]] = mistake_pitches[keep]
+    return played
+
+HUMANIZE_KEYS = ('vary_timing', 'timing_variance', 'vary_articulation', 'articulation',
+                 'enable_drift_correction', 'drift_decay_factor', 'enable_chord_roll', 'humanize_seed')
+RUBATO_KEYS = ('enable_tempo_sway', 'tempo_sway_intensity', 'invert_tempo_sway')
+
+class PlaybackPipeline(StagePipeline):
+    # Besides the GUI settings, config carries 'track_roles' and 'midi_stamp'; a fixed 'humanize_seed' replays the same performance.
+    def __init__(self, song_cache: SongCache):
+        self.song_cache = song_cache
+        super().__init__([
+            Stage('song', self._load_song, config_keys=('midi_file', 'midi_stamp', 'tempo', 'track_roles')),
+            Stage('timeline', self._merge_tracks, ('song',)),
+            Stage('note_beats', self._note_beats, ('timeline', 'song')),
+            Stage('notes', self._assign_hands, ('timeline',), ('track_roles', 'simulate_hands', 'hand_beam_width')),
+            Stage('sections', self._analyze, ('notes', 'song', 'note_beats')),
+            Stage('humanized', self._humanize, ('notes',), HUMANIZE_KEYS),
+            Stage('performance', self._apply_rubato, ('humanized', 'sections'), RUBATO_KEYS),
+            Stage('key_events', self._compile_key_events, ('performance', 'sections'), ('use_88_key_layout', 'enable_mistakes', 'mistake_chance', 'humanize_seed')),
+            Stage('pedal_events', self._compile_pedal_events, ('performance', 'sections'), ('pedal_style',)),
+            Stage('events', self._merge_events, ('key_events', 'pedal_events')),
+        ])
+
+    def _load_song(self, config: Dict) -> Tuple[List, TempoMap]:
+        selected_indices = [index for index, _ in config['track_roles']]
+        return self.song_cache.load(config['midi_file'], config['tempo'] / 100.0, selected_indices)
+
+    @staticmethod
+    def _merge_tracks(config: Dict, song) -> NoteTable:
+        selected_tracks, _ = song
+        timeline = NoteTable.concatenate([track.table for track in selected_tracks])
+        return timeline[timeline.start_order()].freeze()
+
+    @staticmethod
+    def _note_beats(config: Dict, timeline: NoteTable, song) -> Tuple[np.ndarray, np.ndarray]:
+        # Hand assignment keeps the timeline's order and timing, so these beats line up with 'notes'.
+        beats = SectionAnalyzer.note_beats(timeline, song[1])
+        for column in beats: column.flags.writeable = False
+        return beats
+
+    @staticmethod
+    def _assign_hands(config: Dict, timeline: NoteTable) -> NoteTable:
+        final_notes = timeline.copy()
+        for index, role in config['track_roles']:
+            if role == "Left Hand": final_notes.hand[final_notes.track == index] = HAND_LEFT
+            elif role == "Right Hand": final_notes.hand[final_notes.track == index] = HAND_RIGHT
+        if config['simulate_hands']:
+            beam_width = config['hand_beam_width']
+            FingeringEngine(FingeringEngine.DEFAULT_BEAM_WIDTH if beam_width is None else beam_width).assign_hands(final_notes)
+        else:
+            unknown = final_notes.hand == HAND_UNKNOWN
+            final_notes.hand[unknown & (final_notes.pitch < 60)] = HAND_LEFT
+            final_notes.hand[unknown & (final_notes.pitch >= 60)] = HAND_RIGHT
+        # From here on the note set is shared read-only by the timeline, scrub preview, player and cache.
+        return final_notes.freeze()
+
+    @staticmethod
+    def _analyze(config: Dict, notes: NoteTable, song, note_beats) -> List[MusicalSection]:
+        return SectionAnalyzer(notes, song[1], note_beats).analyze()
+
+    @staticmethod
+    def _humanize(config: Dict, notes: NoteTable) -> NoteOverlay:
+        humanizer = Humanizer(config)
+        # Humanization writes only the overlays' start/duration columns.
+        base = NoteOverlay(notes)
+        left_hand_notes = base.of_hand(HAND_LEFT)
+        right_hand_notes = base.of_hand(HAND_RIGHT)
+        resync_points = np.intersect1d(round_hundredths(left_hand_notes.start), round_hundredths(right_hand_notes.start))
+        humanizer.apply_to_hand(left_hand_notes, 'left', resync_points)
+        humanizer.apply_to_hand(right_hand_notes, 'right', resync_points)
+        return NoteOverlay.concatenate([left_hand_notes, right_hand_notes]).sorted_by_start()
+
+    @staticmethod
+    def _apply_rubato(config: Dict, humanized: NoteOverlay, sections: List[MusicalSection]) -> NoteOverlay:
+        performance = NoteOverlay(humanized.base, humanized.index, humanized.start.copy(), humanized.duration)
+        Humanizer(config).apply_tempo_rubato(performance, sections)
+        return performance
+
+    @staticmethod
+    def _compile_key_events(config: Dict, notes_to_play: NoteOverlay, sections: List[MusicalSection]) -> Tuple[np.ndarray, Tuple[str, ...]]:
+        # Press/release events and the keys whose state the player tracks.
+        mapper = KeyMapper(use_88_key_layout=config.get('use_88_key_layout') or False)
+        pitches = notes_to_play.pitch.astype(np.int64)
+        played_pitches = pitches
+        if config.get('enable_mistakes'):
+            # Mistakes draw from their own stream so they are independent of the Humanizer's draws on the same seed.
+            seed = config.get('humanize_seed')
+            rng = np.random.default_rng(None if seed is None else [seed, 1])
+            played_pitches = _draw_mistakes(pitches, section_index(sections, notes_to_play.start),
+                                            (config.get('mistake_chance') or 0) / 100.0, rng, mapper)
+        is_mistake = played_pitches != pitches
+        key_codes, mod_codes = mapper.map_pitches(played_pitches)
+        mapped = key_codes >= 0
+        # Keys are only tracked for correctly played notes; a mistake lands on a key only if
+        # the song also plays that key correctly somewhere.
+        tracked_keys = tuple(mapper.key_chars[code] for code in np.unique(key_codes[mapped & ~is_mistake]).tolist())
+
+        pitches, key_codes, mod_codes = played_pitches[mapped], key_codes[mapped], mod_codes[mapped]
+        presses = build_events(notes_to_play.start[mapped], 2, ACTION_PRESS, key_codes, pitches, mod_codes)
+        releases = build_events(notes_to_play.end[mapped], 4, ACTION_RELEASE, key_codes, pitches, mod_codes)
+        return np.concatenate([presses, releases]), tracked_keys
+
+    @staticmethod
+    def _compile_pedal_events(config: Dict, notes_to_play: NoteOverlay, sections: List[MusicalSection]) -> np.ndarray:
+        pedal_events = PedalGenerator.generate_events(config, notes_to_play, sections)
+        return build_events([e.time for e in pedal_events], [e.priority for e in pedal_events], ACTION_PEDAL,
+                            [PEDAL_DOWN if e.key_char == 'down' else PEDAL_UP for e in pedal_events])
+
+    @staticmethod
+    def _merge_events(config: Dict, key_events, pedal_events: np.ndarray) -> Tuple[np.ndarray, Tuple[str, ...]]:
+        events, tracked_keys = key_events
+        events = np.concatenate([events, pedal_events])
+        events = events[np.lexsort((events['priority'], events['time']))]
+        events.flags.writeable = False
+        return events, tracked_keys
@@ -3,14 +3,11 @@ from pynput import keyboard
 from pynput.keyboard import Key, Controller
 import time
 import threading
-import heapq
-import random
-import bisect
-import copy
-from typing import List, Dict, Optional, Tuple
-from models import Note, KeyEvent, MusicalSection, KeyState
-from core import TempoMap, KeyMapper
-from analysis import Humanizer, PedalGenerator
+import numpy as np
+from typing import List, Dict, Optional
+from models import NoteTable, MusicalSection, KeyState, EVENT_DTYPE, ACTION_PRESS, ACTION_RELEASE, ACTION_PEDAL, PEDAL_DOWN
+from core import TempoMap, KeyMapper, MODIFIER_KEYS
+from pipeline import PlaybackPipeline
 
 class Player(QObject):
     status_updated = Signal(str)
@@ -19,16 +16,18 @@ class Player(QObject):
     visualizer_updated = Signal(list)
     auto_paused = Signal()
 
-    def __init__(self, config: Dict, notes: List[Note], sections: List[MusicalSection], tempo_map: TempoMap):
+    def __init__(self, config: Dict, notes: NoteTable, sections: List[MusicalSection], tempo_map: TempoMap, pipeline: PlaybackPipeline):
         super().__init__()
         self.config = config
+        self.pipeline = pipeline
         self.notes = notes
         self.sections = sections
         self.tempo_map = tempo_map
         self.keyboard = Controller()
         self.mapper = KeyMapper(use_88_key_layout=self.config.get('use_88_key_layout', False))
         
-        self.compiled_events: List[KeyEvent] = []
+        self.compiled_events = np.empty(0, dtype=EVENT_DTYPE)
+        self.event_times = np.empty(0, dtype=np.float64)
         self.event_index = 0
         
         self.stop_event = threading.Event()
@@ -57,19 +56,7 @@ class Player(QObject):
     def play(self):
         try:
             self._log_debug("\n=== STARTING PLAYBACK PROCESS ===")
-            humanized_notes = copy.deepcopy(self.notes)
-            self.humanizer = Humanizer(self.config, self.debug_log)
-            left_hand_notes = [n for n in humanized_notes if n.hand == 'left']
-            right_hand_notes = [n for n in humanized_notes if n.hand == 'right']
-            resync_points = {round(n.start_time, 2) for n in left_hand_notes}.intersection({round(n.start_time, 2) for n in right_hand_notes})
-            
-            self.humanizer.apply_to_hand(left_hand_notes, 'left', resync_points)
-            self.humanizer.apply_to_hand(right_hand_notes, 'right', resync_points)
-            
-            all_notes = sorted(left_hand_notes + right_hand_notes, key=lambda n: n.start_time)
-            self.humanizer.apply_tempo_rubato(all_notes, self.sections)
-            
-            self._compile_event_list(all_notes, self.sections)
+            self._compile_event_list()
             
             if self.config.get('countdown'): self._run_countdown()
             if self.stop_event.is_set():
@@ -121,9 +108,7 @@ class Player(QObject):
 
     def seek(self, target_time: float):
         self.shutdown() 
-        times = [e.time for e in self.compiled_events]
-        new_idx = bisect.bisect_left(times, target_time)
-        self.event_index = new_idx
+        self.event_index = int(np.searchsorted(self.event_times, target_time, side='left'))
         
         now = time.perf_counter()
         if self.pause_event.is_set():
@@ -143,64 +128,16 @@ class Player(QObject):
             self.status_updated.emit(f"{i}...")
             time.sleep(1)
 
-    def _compile_event_list(self, notes_to_play: List[Note], sections: List[MusicalSection]):
+    def _compile_event_list(self):
         self.key_states.clear()
-        use_mistakes = self.config.get('enable_mistakes', False)
-        mistake_chance = self.config.get('mistake_chance', 0) / 100.0
-        
-        temp_heap = []
-        played_pitches_in_section = set()
-        current_section_idx = -1
-        
-        for note in notes_to_play:
-            note_section_idx = -1
-            for i, sec in enumerate(sections):
-                if sec.start_time <= note.start_time < sec.end_time:
-                    note_section_idx = i; break
-            
-            if note_section_idx != current_section_idx:
-                played_pitches_in_section.clear()
-                current_section_idx = note_section_idx
-
-            mistake_scheduled = False
-            is_eligible_for_mistake = note.pitch not in played_pitches_in_section
-            make_mistake = use_mistakes and is_eligible_for_mistake and (random.random() < mistake_chance)
-            
-            if make_mistake:
-                mistake_pitch = self._get_mistake_pitch(note.pitch)
-                if mistake_pitch:
-                    key_data = self.mapper.get_key_data(mistake_pitch)
-                    if key_data:
-                        mk_char = key_data['key']
-                        heapq.heappush(temp_heap, KeyEvent(note.start_time, 2, 'press', mk_char, pitch=mistake_pitch))
-                        heapq.heappush(temp_heap, KeyEvent(note.start_time + note.duration, 4, 'release', mk_char, pitch=mistake_pitch))
-                        mistake_scheduled = True
-
-            if not mistake_scheduled:
-                key_data = self.mapper.get_key_data(note.pitch)
-                if key_data:
-                    key_char = key_data['key']
-                    heapq.heappush(temp_heap, KeyEvent(note.start_time, 2, 'press', key_char, pitch=note.pitch))
-                    heapq.heappush(temp_heap, KeyEvent(note.end_time, 4, 'release', key_char, pitch=note.pitch))
-                    if key_char not in self.key_states: self.key_states[key_char] = KeyState(key_char)
-            
-            played_pitches_in_section.add(note.pitch)
-        
-        pedal_events = PedalGenerator.generate_events(self.config, notes_to_play, sections, self.debug_log)
-        for event in pedal_events: 
-            heapq.heappush(temp_heap, event)
-            
-        self.compiled_events = []
-        while temp_heap:
-            self.compiled_events.append(heapq.heappop(temp_heap))
-            
-        self.total_duration = self.compiled_events[-1].time if self.compiled_events else 0.0
-            
-    def _get_mistake_pitch(self, original_pitch: int) -> Optional[int]:
-        is_black = KeyMapper.is_black_key(original_pitch)
-        if is_black: return original_pitch + random.choice([-2, -1, 1, 2])
-        valid = [p for p in [original_pitch-2, original_pitch-1, original_pitch+1, original_pitch+2] if not KeyMapper.is_black_key(p)]
-        return random.choice(valid) if valid else None
+        events, tracked_keys = self.pipeline.run('events', self.config)
+        self._log_debug(f"Recomputed stages: {', '.join(self.pipeline.recomputed) or 'none'}")
+        for key_char in tracked_keys: self.key_states[key_char] = KeyState(key_char)
+        self.compiled_events = events
+        self.event_times = np.ascontiguousarray(events['time'])
+        self.total_duration = float(self.event_times[-1]) if len(events) else 0.0
+        self._log_debug(f"Compiled {len(events)} events for {len(self.notes)} notes: "
+                        f"{events.nbytes / 1024:.1f} KiB ({events.itemsize} bytes per event)")
 
     def _run_cursor_loop(self):
         self._log_debug("\n=== ENTERING CURSOR LOOP ===")
@@ -235,19 +172,12 @@ class Player(QObject):
                     time.sleep(0.001)
                     continue
 
-            next_event = self.compiled_events[self.event_index]
-            
-            if next_event.time <= playback_time:
-                batch = []
-                while self.event_index < len(self.compiled_events):
-                    e = self.compiled_events[self.event_index]
-                    if e.time <= playback_time:
-                        batch.append(e)
-                        self.event_index += 1
-                    else:
-                        break
+            if self.event_times[self.event_index] <= playback_time:
+                batch_end = int(np.searchsorted(self.event_times, playback_time, side='right'))
+                batch = self.compiled_events[self.event_index:batch_end]
+                self.event_index = batch_end
                 
-                batch.sort(key=lambda x: x.priority)
+                batch = batch[np.argsort(batch['priority'], kind='stable')]
                 self._execute_chord_event(batch, playback_time)
             else:
                 time.sleep(0.001)
@@ -257,31 +187,26 @@ class Player(QObject):
                 self.progress_updated.emit(playback_time)
                 self.last_progress_emit_time = now
 
-    def _get_press_info_from_event(self, event: KeyEvent) -> Tuple[List[Key], str]:
-        if event.pitch is None: return [], event.key_char
-        key_data = self.mapper.get_key_data(event.pitch)
-        if not key_data: return [], event.key_char
-        return key_data['modifiers'], key_data['key']
-        
-    def _execute_chord_event(self, events: List[KeyEvent], playback_time: float):
+    def _execute_chord_event(self, events: np.ndarray, playback_time: float):
         if self.stop_event.is_set(): return
-        press_events = [e for e in events if e.action == 'press']
-        release_events = [e for e in events if e.action == 'release']
-        pedal_events = [e for e in events if e.action == 'pedal']
+        rows = events.tolist()
+        press_events = [r for r in rows if r[2] == ACTION_PRESS]
+        release_events = [r for r in rows if r[2] == ACTION_RELEASE]
+        pedal_events = [r for r in rows if r[2] == ACTION_PEDAL]
+        key_chars = self.mapper.key_chars
 
         state_changed = False 
 
-        for event in pedal_events: 
-            self._log_debug(f"[ACT] {playback_time:.4f}s | PEDAL {event.key_char.upper()} (Delta: {playback_time - event.time:+.4f}s)")
-            self._handle_pedal_event(event)
+        for event_time, _, _, pedal, _, _ in pedal_events: 
+            self._log_debug(f"[ACT] {playback_time:.4f}s | PEDAL {'DOWN' if pedal == PEDAL_DOWN else 'UP'} (Delta: {playback_time - event_time:+.4f}s)")
+            self._handle_pedal_event(pedal == PEDAL_DOWN)
 
-        for event in release_events:
-            self._log_debug(f"[ACT] {playback_time:.4f}s | RELEASE | {event.key_char} (Delta: {playback_time - event.time:+.4f}s)")
-            if event.pitch is not None:
-                self.active_pitches.discard(event.pitch)
-                state_changed = True
+        for event_time, _, _, key_code, pitch, _ in release_events:
+            key_char = key_chars[key_code]
+            self._log_debug(f"[ACT] {playback_time:.4f}s | RELEASE | {key_char} (Delta: {playback_time - event_time:+.4f}s)")
+            self.active_pitches.discard(pitch)
+            state_changed = True
                 
-            key_char = event.key_char
             state = self.key_states.get(key_char)
             if not state: continue
             
@@ -294,16 +219,16 @@ class Player(QObject):
                 self._log_debug(f"      [PHYSICAL] Releasing Key '{base_key}'")
             except: pass
 
-        for event in press_events:
-            self._log_debug(f"[ACT] {playback_time:.4f}s | PRESS   | {event.key_char} (Delta: {playback_time - event.time:+.4f}s)")
-            if event.pitch is not None:
-                self.active_pitches.add(event.pitch)
-                state_changed = True
+        for event_time, _, _, key_code, pitch, mod_code in press_events:
+            base_key = key_chars[key_code]
+            self._log_debug(f"[ACT] {playback_time:.4f}s | PRESS   | {base_key} (Delta: {playback_time - event_time:+.4f}s)")
+            self.active_pitches.add(pitch)
+            state_changed = True
                 
-            state = self.key_states.get(event.key_char)
-            if not state or event.pitch is None: continue
+            state = self.key_states.get(base_key)
+            if not state: continue
             
-            modifiers, base_key = self._get_press_info_from_event(event)
+            modifiers = MODIFIER_KEYS[mod_code]
             
             was_physically_down = state.is_physically_down
             is_sustained_only = state.is_sustained and not state.is_active
@@ -324,15 +249,15 @@ class Player(QObject):
         if state_changed:
             self.visualizer_updated.emit(list(self.active_pitches))
 
-    def _handle_pedal_event(self, event: KeyEvent):
+    def _handle_pedal_event(self, is_down: bool):
         if self.stop_event.is_set(): return
-        if event.key_char == 'down' and not self.pedal_is_down:
+        if is_down and not self.pedal_is_down:
             self.pedal_is_down = True
             try: 
                 self.keyboard.press(Key.space)
                 self._log_debug("      [PHYSICAL] Pressing Space (Pedal)")
             except Exception: pass
-        elif event.key_char == 'up' and self.pedal_is_down:
+        elif not is_down and self.pedal_is_down:
             self.pedal_is_down = False
             try: 
                 self.keyboard.release(Key.space)
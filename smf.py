@@ -0,0 +1,329 @@
+import os
+import mmap
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, replace
+from typing import List, Tuple, Optional, Sequence, Iterable, Iterator
+import numpy as np
+from mido.midifiles.meta import build_meta_message
+
+MAX_MESSAGE_LENGTH = 1_000_000
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+class SmfFallback(Exception):
+    # Raised when a file needs mido's reader: malformed data, SMPTE timing or exotic status bytes.
+    pass
+
+@dataclass
+class TrackEvents:
+    index: int
+    name: str
+    program_change: int = 0
+    is_drum: bool = False
+    ticks: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    is_on: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))
+    channel: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int8))
+    pitch: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int16))
+    velocity: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int16))
+    tempo_events: List[Tuple[int, int]] = field(default_factory=list)
+    time_signatures: List[Tuple[int, int, int]] = field(default_factory=list)
+    note_on_count: int = 0
+    has_drum_notes: bool = False
+
+    @classmethod
+    def from_columns(cls, index: int, name: str, program_change: int, is_drum: bool, ticks, is_on, channel, pitch, velocity,
+                     tempo_events=None, time_signatures=None) -> 'TrackEvents':
+        is_on, channel = np.asarray(is_on, dtype=bool), np.asarray(channel, dtype=np.int8)
+        return cls(index, name, program_change, is_drum,
+                   np.asarray(ticks, dtype=np.int64), is_on, channel,
+                   np.asarray(pitch, dtype=np.int16), np.asarray(velocity, dtype=np.int16),
+                   tempo_events or [], time_signatures or [],
+                   int(np.count_nonzero(is_on)), bool(np.any(channel[is_on] == 9)))
+
+    def without_notes(self) -> 'TrackEvents':
+        return replace(self, ticks=self.ticks[:0], is_on=self.is_on[:0], channel=self.channel[:0], pitch=self.pitch[:0], velocity=self.velocity[:0])
+
+PAIR_FIFO, PAIR_LIFO = 'fifo', 'lifo'
+
+@dataclass
+class NotePairs:
+    start_tick: np.ndarray
+    end_tick: np.ndarray
+    channel: np.ndarray
+    pitch: np.ndarray
+    velocity: np.ndarray
+    orphan_note_ons: int = 0
+    orphan_note_offs: int = 0
+
+    def __len__(self) -> int:
+        return len(self.start_tick)
+
+class NotePairer:
+    # Matches note-offs to open note-ons of the same (channel, pitch), oldest first (FIFO) or newest first (LIFO).
+
+    def __init__(self, policy: str = PAIR_FIFO):
+        if policy not in (PAIR_FIFO, PAIR_LIFO): raise ValueError(f"Unknown pairing policy: {policy}")
+        self.policy = policy
+        self.orphan_note_ons = 0
+        self.orphan_note_offs = 0
+
+    def pair(self, events: TrackEvents) -> NotePairs:
+        n = len(events.ticks)
+        if not n: return NotePairs(events.ticks, events.ticks, events.channel, events.pitch, events.velocity)
+        key = events.channel.astype(np.int64) * 128 + events.pitch
+        order = np.argsort(key, kind='stable')
+        key, is_on = key[order], events.is_on[order]
+        group_start = np.empty(n, dtype=bool)
+        group_start[:1] = True
+        np.not_equal(key[1:], key[:-1], out=group_start[1:])
+        group_id = np.cumsum(group_start) - 1
+        starts = np.flatnonzero(group_start)
+
+        # Open-note depth per key is a running sum of +1/-1 reflected at zero: a note-off with nothing open is dropped.
+        level = np.cumsum(np.where(is_on, 1, -1))
+        level -= np.repeat(level[starts] - np.where(is_on[starts], 1, -1), np.diff(np.append(starts, n)))
+        spread = 2 * n + 2
+        floor = np.minimum.accumulate(np.minimum(level, 0) - group_id * spread) + group_id * spread
+        depth = level - floor
+        depth_before = np.empty(n, dtype=np.int64)
+        depth_before[:1] = 0
+        depth_before[1:] = depth[:-1]
+        depth_before[starts] = 0
+        matched_off = ~is_on & (depth_before > 0)
+
+        if self.policy == PAIR_FIFO:
+            # Queues pop in push order, so the j-th matched off of a key closes its j-th note-on.
+            on_rank = np.cumsum(is_on) - 1
+            on_rank -= np.repeat(on_rank[starts] - is_on[starts] + 1, np.diff(np.append(starts, n)))
+            closed = np.bincount(group_id[matched_off], minlength=len(starts))
+            on_pos = np.flatnonzero(is_on & (on_rank < closed[group_id]))
+            off_pos = np.flatnonzero(matched_off)
+        else:
+            # A stack pairs each note-on with the next matched off that returns to its depth.
+            stack_level = np.where(is_on, depth, depth_before)
+            candidates = np.flatnonzero(is_on | matched_off)
+            nested = candidates[np.lexsort((candidates, stack_level[candidates], key[candidates]))]
+            pair_at = np.flatnonzero(is_on[nested[:-1]] & ~is_on[nested[1:]] &
+                                     (key[nested[:-1]] == key[nested[1:]]) & (stack_level[nested[:-1]] == stack_level[nested[1:]]))
+            on_pos, off_pos = nested[pair_at], nested[pair_at + 1]
+
+        # Emit pairs in note-off order, as they close while the track is read.
+        on_idx, off_idx = order[on_pos], order[off_pos]
+        by_close = np.argsort(off_idx, kind='stable')
+        on_idx, off_idx = on_idx[by_close], off_idx[by_close]
+        pairs = NotePairs(events.ticks[on_idx], events.ticks[off_idx], events.channel[on_idx], events.pitch[on_idx], events.velocity[on_idx],
+                          int(np.count_nonzero(is_on)) - len(on_idx), int(np.count_nonzero(~is_on)) - len(off_idx))
+        self.orphan_note_ons += pairs.orphan_note_ons
+        self.orphan_note_offs += pairs.orphan_note_offs
+        return pairs
+
+@dataclass
+class TrackCursor:
+    index: int
+    pos: int
+    end: int
+    tick: int = 0
+    status: int = 0
+
+class SmfFile:
+    # Memory-mapped Standard MIDI File decoded straight from track chunk bytes.
+
+    def __init__(self, filepath: str):
+        self._file = open(filepath, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise SmfFallback(f"cannot map file: {e}")
+        try:
+            self._read_chunks()
+        except SmfFallback:
+            self.close()
+            raise
+
+    def _read_chunks(self):
+        size = len(self._mmap)
+        if size < 14 or self._mmap[:4] != b'MThd': raise SmfFallback("no MThd header")
+        header_size = struct.unpack_from('>L', self._mmap, 4)[0]
+        if header_size < 6 or 8 + header_size > size: raise SmfFallback("truncated header")
+        self.type, num_tracks, self.ticks_per_beat = struct.unpack_from('>hhh', self._mmap, 8)
+        if self.ticks_per_beat < 0: raise SmfFallback("SMPTE time division")
+        self.track_spans: List[Tuple[int, int]] = []
+        pos = 8 + header_size
+        for _ in range(max(num_tracks, 0)):
+            if pos + 8 > size: raise SmfFallback("missing track chunk")
+            name, length = struct.unpack_from('>4sL', self._mmap, pos)
+            if name != b'MTrk': raise SmfFallback(f"unexpected chunk {name!r}")
+            pos += 8
+            if pos + length > size: raise SmfFallback("truncated track chunk")
+            self.track_spans.append((pos, pos + length))
+            pos += length
+
+    def __len__(self) -> int:
+        return len(self.track_spans)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'SmfFile':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def decode_track(self, index: int) -> TrackEvents:
+        return self._decode(TrackCursor(index, *self.track_spans[index]), True)
+
+    def scan_track(self, index: int) -> TrackEvents:
+        # Metadata and note-on count only, without collecting note events.
+        return self._decode(TrackCursor(index, *self.track_spans[index]), False)
+
+    def iter_track_chunks(self, index: int, chunk_notes: int = 4096) -> Iterator[TrackEvents]:
+        # Decodes lazily, at most chunk_notes note events at a time.
+        cursor = TrackCursor(index, *self.track_spans[index])
+        while cursor.pos < cursor.end:
+            yield self._decode(cursor, True, chunk_notes)
+
+    def _decode(self, cursor: TrackCursor, collect_notes: bool, max_notes: int = 0) -> TrackEvents:
+        try:
+            return self._decode_span(cursor, collect_notes, max_notes)
+        except IndexError:
+            raise SmfFallback(f"track {cursor.index} runs past end of file")
+
+    def _decode_span(self, cursor: TrackCursor, collect_notes: bool, max_notes: int) -> TrackEvents:
+        buf = self._mmap
+        index, pos, end, tick, status = cursor.index, cursor.pos, cursor.end, cursor.tick, cursor.status
+        ticks, is_on, channels, pitches, velocities = array('q'), array('b'), array('b'), array('h'), array('h')
+        name, program_change, is_drum = f"Track {index}", 0, False
+        tempo_events, time_signatures = [], []
+        note_on_count, has_drum_notes = 0, False
+
+        while pos < end:
+            byte = buf[pos]; pos += 1
+            delta = byte & 0x7f
+            while byte & 0x80:
+                byte = buf[pos]; pos += 1
+                delta = (delta << 7) | (byte & 0x7f)
+            tick += delta
+
+            byte = buf[pos]
+            if byte & 0x80:
+                pos += 1
+                if byte != 0xff: status = byte
+            elif status == 0 or status >= 0xf0:
+                raise SmfFallback(f"running status without a channel status in track {index}")
+            else:
+                byte = status
+
+            kind = byte & 0xf0
+            if kind == 0x90 or kind == 0x80:
+                note, velocity = buf[pos], buf[pos + 1]; pos += 2
+                if (note | velocity) & 0x80: raise SmfFallback(f"invalid data byte in track {index}")
+                if collect_notes:
+                    ticks.append(tick)
+                    is_on.append(kind == 0x90 and velocity > 0)
+                    channels.append(byte & 0x0f)
+                    pitches.append(note)
+                    velocities.append(velocity)
+                    if len(ticks) == max_notes: break
+                elif kind == 0x90 and velocity:
+                    note_on_count += 1
+                    if byte & 0x0f == 9: has_drum_notes = True
+            elif kind == 0xc0:
+                program = buf[pos]; pos += 1
+                if program & 0x80: raise SmfFallback(f"invalid data byte in track {index}")
+                program_change = program
+                if byte & 0x0f == 9: is_drum = True
+            elif kind == 0xd0:
+                if buf[pos] & 0x80: raise SmfFallback(f"invalid data byte in track {index}")
+                pos += 1
+            elif kind != 0xf0:
+                if (buf[pos] | buf[pos + 1]) & 0x80: raise SmfFallback(f"invalid data byte in track {index}")
+                pos += 2
+            elif byte == 0xff:
+                meta_type = buf[pos]; pos += 1
+                length, pos = self._read_length(buf, pos)
+                data = buf[pos:pos + length]; pos += length
+                if len(data) < length: raise IndexError
+                try:
+                    msg = build_meta_message(meta_type, list(data))
+                except Exception as e:
+                    raise SmfFallback(f"bad meta message in track {index}: {e}")
+                if msg.type == 'track_name': name = msg.name
+                elif msg.type == 'set_tempo': tempo_events.append((tick, msg.tempo))
+                elif msg.type == 'time_signature': time_signatures.append((tick, msg.numerator, msg.denominator))
+            elif byte == 0xf0 or byte == 0xf7:
+                length, pos = self._read_length(buf, pos)
+                data = buf[pos:pos + length]; pos += length
+                if len(data) < length: raise IndexError
+                if data[:1] == b'\xf0': data = data[1:]
+                if data[-1:] == b'\xf7': data = data[:-1]
+                if data and max(data) > 127: raise SmfFallback(f"invalid sysex data in track {index}")
+            else:
+                raise SmfFallback(f"system status 0x{byte:02x} in track {index}")
+
+        if pos > end: raise SmfFallback(f"track {index} overruns its chunk")
+        cursor.pos, cursor.tick, cursor.status = pos, tick, status
+        events = TrackEvents.from_columns(index, name, program_change, is_drum, ticks, is_on, channels, pitches, velocities,
+                                          tempo_events, time_signatures)
+        if not collect_notes: events.note_on_count, events.has_drum_notes = note_on_count, has_drum_notes
+        return events
+
+    def worker_count(self, tracks: Optional[Iterable[int]] = None) -> int:
+        spans = self.track_spans if tracks is None else [self.track_spans[i] for i in tracks]
+        if sum(end - start for start, end in spans) < PARALLEL_MIN_BYTES: return 1
+        return max(1, min(os.cpu_count() or 1, len(spans)))
+
+    def decode_and_pair(self, policy: str = PAIR_FIFO, workers: Optional[int] = None,
+                        tracks: Optional[Sequence[int]] = None) -> List[Tuple[TrackEvents, Optional[NotePairs]]]:
+        # Pairs the selected tracks (all by default) and only scans the rest; the TrackEvents keep just the metadata.
+        selected = set(range(len(self.track_spans)))
+        if tracks is not None: selected.intersection_update(tracks)
+        # A scan-only call still walks every track, so its pool is sized over all of them.
+        spanned = selected or range(len(self.track_spans))
+        workers = self.worker_count(spanned) if workers is None else min(workers, len(spanned))
+        if workers > 1:
+            try:
+                return self._decode_and_pair_parallel(policy, workers, selected)
+            except (OSError, BrokenProcessPool):
+                pass
+        pairer = NotePairer(policy)
+        results = []
+        for i in range(len(self.track_spans)):
+            if i not in selected:
+                results.append((self.scan_track(i), None))
+                continue
+            events = self.decode_track(i)
+            results.append((events.without_notes(), pairer.pair(events)))
+        return results
+
+    def _decode_and_pair_parallel(self, policy: str, workers: int, selected) -> List[Tuple[TrackEvents, Optional[NotePairs]]]:
+        # Largest chunks first so one huge track does not start last and hold up the pool.
+        by_size = sorted(range(len(self.track_spans)), key=lambda i: self.track_spans[i][0] - self.track_spans[i][1])
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_file, initargs=(self._file.name,)) as pool:
+            futures = {i: pool.submit(_decode_and_pair_in_worker, i, policy, i in selected) for i in by_size}
+            return [futures[i].result() for i in range(len(self.track_spans))]
+
+    @staticmethod
+    def _read_length(buf, pos: int) -> Tuple[int, int]:
+        byte = buf[pos]; pos += 1
+        length = byte & 0x7f
+        while byte & 0x80:
+            byte = buf[pos]; pos += 1
+            length = (length << 7) | (byte & 0x7f)
+        if length > MAX_MESSAGE_LENGTH: raise SmfFallback(f"message length {length} exceeds maximum")
+        return length, pos
+
+_worker_file: Optional[SmfFile] = None
+
+def _open_worker_file(filepath: str):
+    global _worker_file
+    _worker_file = SmfFile(filepath)
+
+def _decode_and_pair_in_worker(index: int, policy: str, decode: bool) -> Tuple[TrackEvents, Optional[NotePairs]]:
+    if not decode: return _worker_file.scan_track(index), None
+    events = _worker_file.decode_track(index)
+    return events.without_notes(), NotePairer(policy).pair(events)
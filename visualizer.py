@@ -1,8 +1,9 @@
 from PyQt6.QtWidgets import QWidget, QSizePolicy
 from PyQt6.QtCore import Qt, QRectF, QPointF, pyqtSignal as Signal
 from PyQt6.QtGui import QPainter, QBrush, QColor, QPen, QPixmap
-from typing import List, Set
-from models import Note
+import numpy as np
+from typing import Set
+from models import NoteTable, HAND_LEFT, HAND_RIGHT
 from core import TempoMap
 
 class PianoWidget(QWidget):
@@ -76,7 +77,7 @@ class TimelineWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Expanding)
-        self.notes = []
+        self.notes = NoteTable()
         self.total_duration = 1.0
         self.current_time = 0.0
         self.is_dragging = False
@@ -92,7 +93,7 @@ class TimelineWidget(QWidget):
         self.cursor_color = QColor(255, 255, 255)
         self.measure_line_color = QColor(255, 255, 255, 50)
         
-    def set_data(self, notes: List[Note], duration: float, tempo_map: TempoMap = None):
+    def set_data(self, notes: NoteTable, duration: float, tempo_map: TempoMap = None):
         self.notes = notes
         self.total_duration = max(duration, 0.1)
         self.tempo_map = tempo_map
@@ -148,35 +149,28 @@ class TimelineWidget(QWidget):
             if self.tempo_map:
                 cache_painter.setPen(QPen(self.measure_line_color, 1))
                 try:
-                    boundaries = self.tempo_map.get_measure_boundaries(self.total_duration)
-                    for start_t, end_t in boundaries:
-                        x = (start_t / self.total_duration) * w
+                    grid = self.tempo_map.measure_grid(self.total_duration)
+                    for x in ((grid.start_times / self.total_duration) * w).tolist():
                         cache_painter.drawLine(QPointF(x, 0), QPointF(x, h))
                 except Exception: pass
 
-            if self.notes:
+            if len(self.notes):
                 min_p = 21
                 max_p = 108
                 range_p = max_p - min_p
                 
                 cache_painter.setPen(Qt.PenStyle.NoPen)
                 
-                for note in self.notes:
-                    nx = (note.start_time / self.total_duration) * w
-                    nw = (note.duration / self.total_duration) * w
-                    nw = max(1.0, nw)
-                    
-                    ny_ratio = 1.0 - ((note.pitch - min_p) / range_p)
-                    ny = ny_ratio * (h - 10) + 5
-                    nh = 8 
-                    
-                    if note.hand == 'left':
-                        cache_painter.setBrush(QBrush(self.left_hand_color))
-                    elif note.hand == 'right':
-                        cache_painter.setBrush(QBrush(self.right_hand_color))
-                    else:
-                        cache_painter.setBrush(QBrush(self.unknown_color))
-                    
+                xs = ((self.notes.start / self.total_duration) * w).tolist()
+                widths = np.maximum((self.notes.duration / self.total_duration) * w, 1.0).tolist()
+                ny_ratio = 1.0 - ((self.notes.pitch - min_p) / range_p)
+                ys = (ny_ratio * (h - 10) + 5).tolist()
+                nh = 8 
+                brushes = {HAND_LEFT: QBrush(self.left_hand_color), HAND_RIGHT: QBrush(self.right_hand_color)}
+                unknown_brush = QBrush(self.unknown_color)
+                
+                for nx, ny, nw, hand in zip(xs, ys, widths, self.notes.hand.tolist()):
+                    cache_painter.setBrush(brushes.get(hand, unknown_brush))
                     cache_painter.drawRect(QRectF(nx, ny, nw, nh))
             
             cache_painter.end()